@@ -0,0 +1,62 @@
+import argparse
+import os
+import time
+
+from detectors.ball_detector import BallAquisitionDetector
+from utils import read_stub, TrackTable
+
+
+def time_call(function, repeat):
+    """
+    Run a function several times and keep the fastest run.
+
+    Args:
+        function (callable): The function to time, called without arguments.
+        repeat (int): Number of runs.
+
+    Returns:
+        tuple: (result of the last run, fastest run time in seconds)
+    """
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main(stub_path, repeat):
+    """
+    Compare the vectorized and per-frame ball possession detection on recorded stubs.
+
+    Args:
+        stub_path (str): Directory holding the player and ball track stubs written by main.py.
+        repeat (int): Number of timed runs of each implementation.
+    """
+    player_tracks = read_stub(True, os.path.join(stub_path, 'player_Track_stubs.pkl'))
+    ball_tracks = read_stub(True, os.path.join(stub_path, 'ball_track_stubs.pkl'))
+    if player_tracks is None or ball_tracks is None:
+        raise SystemExit(f"no player/ball track stubs found in {stub_path}, run main.py first")
+
+    detector = BallAquisitionDetector()
+    per_frame, per_frame_time = time_call(lambda: detector.detect_ball_possession_per_frame(player_tracks, ball_tracks), repeat)
+    vectorized, vectorized_time = time_call(lambda: detector.detect_ball_possession(player_tracks, ball_tracks), repeat)
+    player_table = TrackTable.from_frame_dicts(player_tracks)
+    from_table, from_table_time = time_call(lambda: detector.detect_ball_possession(player_table, ball_tracks), repeat)
+
+    print(f"frames: {len(ball_tracks)}, player detections: {len(player_table)}")
+    print(f"per frame:           {per_frame_time * 1000:.1f} ms")
+    print(f"vectorized (dicts):  {vectorized_time * 1000:.1f} ms ({per_frame_time / vectorized_time:.1f}x)")
+    print(f"vectorized (table):  {from_table_time * 1000:.1f} ms ({per_frame_time / from_table_time:.1f}x)")
+    print(f"same output (dicts): {per_frame == vectorized}")
+    # the table stores boxes as float32, which is exact for detector output
+    print(f"same output (table): {per_frame == from_table}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark ball possession detection on recorded stubs.")
+    parser.add_argument('stub_path', nargs='?', default='stubs')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.stub_path, args.repeat)
@@ -3,3 +3,5 @@ from .pass_detector import PassAndInterceptionDetector
 from .court_detector import CourtKeypointDetector
 from .ball_detector import BallAquisitionDetector
 from .tactical_view import TacticalViewConverter
+
+from .homography import Homography, HomographyCache
\ No newline at end of file
@@ -1,6 +1,8 @@
+import numpy as np
 import sys 
 sys.path.append('../')
 from utils.bbox_utils import measure_distance, get_center_of_bbox
+from utils.track_table import TrackTable
 
 class BallAquisitionDetector:
     """
@@ -169,7 +171,179 @@ class BallAquisitionDetector:
         """
         Detect which player has the ball in each frame based on bounding box information.
 
-        Loops through all frames, looks up ball bounding boxes and player bounding boxes,
+        Computes the containment ratio and minimum key point distance of every
+        (frame, player) pair at once, picks the best candidate of each frame and then
+        requires a player to hold possession for at least min_frames consecutive frames
+        before confirming possession. The result is the same as
+        detect_ball_possession_per_frame.
+
+        Args:
+            player_tracks (list or TrackTable): A list of dictionaries for each frame, where
+                each dictionary maps player_id to player information including 'bbox'.
+            ball_tracks (list): A list of dictionaries for each frame, where each dictionary
+                maps ball_id to ball information including 'bbox'.
+
+        Returns:
+            list: A list of length num_frames with the player_id who has possession,
+            or -1 if no one is determined to have possession in that frame.
+        """
+        best_player_ids = self.find_best_candidates_for_possession(player_tracks, ball_tracks)
+        return self.apply_consecutive_possession(best_player_ids).tolist()
+
+    def find_best_candidates_for_possession(self, player_tracks, ball_tracks):
+        """
+        Determine the most likely ball holder of every frame in one pass.
+
+        Applies the rules of find_best_candidate_for_possession to all frames at once.
+        Frames without a ball are marked -2, frames where nobody is close enough -1.
+
+        Args:
+            player_tracks (list or TrackTable): Player tracks of each frame.
+            ball_tracks (list): Ball tracks of each frame.
+
+        Returns:
+            numpy.ndarray: Best player ID of each frame, shape (len(ball_tracks),).
+        """
+        num_frames = len(ball_tracks)
+        ball_bboxes = np.full((num_frames, 4), np.nan)
+        has_ball = np.zeros(num_frames, dtype=bool)
+        for frame_num, ball_track in enumerate(ball_tracks):
+            ball_bbox = ball_track.get(1, {}).get('bbox', [])
+            if len(ball_bbox):
+                ball_bboxes[frame_num] = ball_bbox
+                has_ball[frame_num] = True
+
+        best_player_ids = np.full(num_frames, -1, dtype=np.int64)
+        best_player_ids[~has_ball] = -2
+
+        if not isinstance(player_tracks, TrackTable):
+            player_tracks = TrackTable.from_frame_dicts(player_tracks[:num_frames], bbox_dtype=np.float64)
+        rows = player_tracks.frame_index < num_frames
+        rows[rows] = has_ball[player_tracks.frame_index[rows]]
+        players = player_tracks.select(rows)
+        if len(players) == 0:
+            return best_player_ids
+
+        # one row per (frame, player) pair, computed in float64 like the per-frame code
+        player_bbox = players.bbox.astype(np.float64)
+        ball_bbox = ball_bboxes[players.frame_index]
+        containment = self.calculate_ball_containment_ratios(player_bbox, ball_bbox)
+        # same truncation as get_center_of_bbox
+        ball_center = np.trunc(np.column_stack(((ball_bbox[:, 0] + ball_bbox[:, 2]) / 2, (ball_bbox[:, 1] + ball_bbox[:, 3]) / 2)))
+        min_distance = self.find_minimum_distances_to_ball(ball_center, player_bbox)
+
+        # per frame: the high containment player furthest from the ball wins, otherwise
+        # the closest player under the threshold; ties go to the first player like max/min
+        high_containment = containment > self.containment_threshold
+        counts = players.detections_per_frame()
+        frames = np.flatnonzero(counts)
+        starts = players.frame_offsets[frames]
+        row_numbers = np.arange(len(players))
+
+        high_key = np.where(high_containment, min_distance, -np.inf)
+        high_best = np.maximum.reduceat(high_key, starts)
+        frame_has_high = np.logical_or.reduceat(high_containment, starts)
+
+        regular_key = np.where(high_containment, np.inf, min_distance)
+        regular_best = np.minimum.reduceat(regular_key, starts)
+
+        row_frame = np.repeat(np.arange(len(frames)), counts[frames])
+        winners = np.where(frame_has_high[row_frame],
+                           high_containment & (high_key == high_best[row_frame]),
+                           ~high_containment & (regular_key == regular_best[row_frame]))
+        first_winner = np.minimum.reduceat(np.where(winners, row_numbers, len(players)), starts)
+
+        found = (first_winner < len(players)) & (frame_has_high | (regular_best < self.possession_threshold))
+        best_player_ids[frames[found]] = players.track_id[first_winner[found]]
+        return best_player_ids
+
+    def calculate_ball_containment_ratios(self, player_bboxes, ball_bboxes):
+        """
+        Vectorized calculate_ball_containment_ratio over matching rows of boxes.
+
+        Args:
+            player_bboxes (numpy.ndarray): Player boxes (x1, y1, x2, y2), shape (N, 4).
+            ball_bboxes (numpy.ndarray): Ball boxes (x1, y1, x2, y2), shape (N, 4).
+
+        Returns:
+            numpy.ndarray: Fraction of each ball box inside the player box, shape (N,).
+        """
+        intersection_x1 = np.maximum(player_bboxes[:, 0], ball_bboxes[:, 0])
+        intersection_y1 = np.maximum(player_bboxes[:, 1], ball_bboxes[:, 1])
+        intersection_x2 = np.minimum(player_bboxes[:, 2], ball_bboxes[:, 2])
+        intersection_y2 = np.minimum(player_bboxes[:, 3], ball_bboxes[:, 3])
+
+        intersection_area = (intersection_x2 - intersection_x1) * (intersection_y2 - intersection_y1)
+        ball_area = (ball_bboxes[:, 2] - ball_bboxes[:, 0]) * (ball_bboxes[:, 3] - ball_bboxes[:, 1])
+        overlaps = (intersection_x2 >= intersection_x1) & (intersection_y2 >= intersection_y1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(overlaps, intersection_area / ball_area, 0.0)
+
+    def find_minimum_distances_to_ball(self, ball_centers, player_bboxes):
+        """
+        Vectorized find_minimum_distance_to_ball over matching rows.
+
+        Builds the same key points as get_key_basketball_player_assignment_points for
+        every row; the points that only apply when the ball is level with the box are
+        given an infinite distance otherwise.
+
+        Args:
+            ball_centers (numpy.ndarray): Ball centers (x, y), shape (N, 2).
+            player_bboxes (numpy.ndarray): Player boxes (x1, y1, x2, y2), shape (N, 4).
+
+        Returns:
+            numpy.ndarray: Smallest key point distance of each row, shape (N,).
+        """
+        ball_x = ball_centers[:, 0]
+        ball_y = ball_centers[:, 1]
+        x1, y1, x2, y2 = player_bboxes.T
+        center_x = x1 + (x2 - x1) // 2
+        center_y = y1 + (y2 - y1) // 2
+        third_y = y1 + (y2 - y1) // 3
+
+        # (N, 14) key points: 4 conditional side points, then the 10 fixed ones
+        points_x = np.column_stack((x1, x2, ball_x, ball_x,
+                                    center_x, x2, x1, x2, x1, center_x, x2, x1, center_x, center_x))
+        points_y = np.column_stack((ball_y, ball_y, y1, y2,
+                                    y1, y1, y1, center_y, center_y, center_y, y2, y2, y2, third_y))
+        distances = np.sqrt((ball_x[:, None] - points_x) ** 2 + (ball_y[:, None] - points_y) ** 2)
+
+        level_y = (ball_y > y1) & (ball_y < y2)
+        level_x = (ball_x > x1) & (ball_x < x2)
+        distances[:, 0:2] = np.where(level_y[:, None], distances[:, 0:2], np.inf)
+        distances[:, 2:4] = np.where(level_x[:, None], distances[:, 2:4], np.inf)
+        return distances.min(axis=1)
+
+    def apply_consecutive_possession(self, best_player_ids):
+        """
+        Confirm possession only after min_frames consecutive frames with the same holder.
+
+        Frames without a ball (-2) neither extend nor break a run; frames without a
+        holder (-1) break it.
+
+        Args:
+            best_player_ids (numpy.ndarray): Best player ID of each frame.
+
+        Returns:
+            numpy.ndarray: Confirmed player ID of each frame, or -1.
+        """
+        possession = np.full(len(best_player_ids), -1, dtype=np.int64)
+        frames = np.flatnonzero(best_player_ids != -2)
+        if len(frames) == 0:
+            return possession
+        holders = best_player_ids[frames]
+        run_starts = np.flatnonzero(np.r_[True, holders[1:] != holders[:-1]])
+        run_lengths = np.diff(np.r_[run_starts, len(holders)])
+        position_in_run = np.arange(len(holders)) - np.repeat(run_starts, run_lengths) + 1
+        confirmed = (holders != -1) & (position_in_run >= self.min_frames)
+        possession[frames[confirmed]] = holders[confirmed]
+        return possession
+
+    def detect_ball_possession_per_frame(self, player_tracks, ball_tracks):
+        """
+        Detect which player has the ball in each frame, one frame and player at a time.
+
+        This is the reference implementation of detect_ball_possession. It loops through all frames, looks up ball bounding boxes and player bounding boxes,
         and uses find_best_candidate_for_possession to determine who has the ball.
         Requires a player to hold possession for at least min_frames consecutive frames
         before confirming possession.
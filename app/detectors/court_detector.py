@@ -1,25 +1,160 @@
 from ultralytics import YOLO
 import supervision as sv
+import cv2
+import numpy as np
 import sys 
 sys.path.append('../')
-from utils import read_stub, save_stub
+from utils import read_stub, save_stub, iter_frame_batches, stub_matches_frames
 
 
 class CourtKeypointDetector:
     """
     The CourtKeypointDetector class uses a YOLO model to detect court keypoints in image frames. 
     It also provides functionality to draw these detected keypoints on the frames.
+
+    In keyframe mode the model only runs when the camera moved. Each frame is compared with
+    the last keyframe on a small grayscale copy by following the keyframe's corners with
+    sparse optical flow, see is_keyframe. Frames where the camera held still get the
+    last keyframe's keypoints instead of a model call. The state carries over between calls to
+    detect_keypoints, so batches must be passed in frame order.
+
+    Attributes:
+        use_keyframes (bool): Whether the model only runs on camera-motion keyframes.
+        motion_width (int): Width in pixels of the grayscale copy used to detect motion.
+        max_shift (float): Largest camera shift, and median deviation from it, in
+            full-frame pixels of a frame that reuses the last keyframe's keypoints.
+        min_corners (int): Fewest corners to follow for motion to be measured at all.
+        min_found_fraction (float): Smallest fraction of the keyframe's corners found again
+            in a frame that reuses the last keyframe's keypoints.
+        max_keyframe_interval (int): Frames after which the model runs again even when
+            the camera held still.
+        keyframe_counts (dict): Frames run through the model ('keyframe') and given the
+            last keyframe's keypoints ('propagated').
     """
-    def __init__(self, model_path):
+    def __init__(self,
+                 model_path,
+                 use_keyframes=False,
+                 motion_width=320,
+                 max_shift=3.0,
+                 min_corners=20,
+                 min_found_fraction=0.5,
+                 max_keyframe_interval=50,
+                 ):
         self.model = YOLO(model_path)
-    
+        self.batch_size = 20
+
+        self.use_keyframes = use_keyframes
+        self.motion_width = motion_width
+        self.max_shift = max_shift
+        self.min_corners = min_corners
+        self.min_found_fraction = min_found_fraction
+        self.max_keyframe_interval = max_keyframe_interval
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the last keyframe and the counters, e.g. before processing another video.
+        """
+        self.keyframe_image = None
+        self.keyframe_corners = None
+        self.keyframe_keypoints = None
+        self.frames_since_keyframe = 0
+        self.keyframe_counts = {'keyframe': 0, 'propagated': 0}
+
+    def detect_keypoints(self, frames):
+        """
+        Detect court keypoints for a batch of frames.
+
+        In keyframe mode only the frames where the camera moved are passed to the model,
+        in one batched call, and the other frames get the keypoints of the keyframe before them.
+
+        Args:
+            frames (list of numpy.ndarray): Frames on which to detect keypoints.
+
+        Returns:
+            list: The detected keypoints for each input frame.
+        """
+        if not self.use_keyframes:
+            detections_batch = self.model.predict(frames,conf=0.5)
+            return [detection.keypoints for detection in detections_batch]
+
+        # decide the keyframes first, they only depend on the images
+        is_keyframe = [self.is_keyframe(frame) for frame in frames]
+        keyframes = [frame for frame, keyframe in zip(frames, is_keyframe) if keyframe]
+        detections = iter(self.model.predict(keyframes,conf=0.5) if keyframes else [])
+
+        keypoints = []
+        for keyframe in is_keyframe:
+            if keyframe:
+                self.keyframe_keypoints = next(detections).keypoints
+                keypoints.append(self.keyframe_keypoints)
+                self.keyframe_counts['keyframe'] += 1
+            else:
+                keypoints.append(self.keyframe_keypoints)
+                self.keyframe_counts['propagated'] += 1
+        return keypoints
+
+    def is_keyframe(self, frame):
+        """
+        Decide whether the court keypoints of a frame have to be detected again, and make
+        the frame the reference for the following ones if so.
+
+        Corners of the last keyframe are followed into the frame with sparse optical flow.
+        The median flow is the camera shift, and the median deviation from it grows with
+        zooms; both ignore the minority of corners sitting on moving players.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame.
+
+        Returns:
+            bool: True when the camera moved since the last keyframe, too few corners could
+                be followed (e.g. a cut), the last keyframe is max_keyframe_interval frames
+                old, or there is no keyframe yet.
+        """
+        scale = self.motion_width / frame.shape[1]
+        image = cv2.resize(frame, (self.motion_width, max(1, round(frame.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        if (self.keyframe_corners is not None
+                and len(self.keyframe_corners) >= self.min_corners
+                and self.frames_since_keyframe < self.max_keyframe_interval):
+            corners, status, _ = cv2.calcOpticalFlowPyrLK(self.keyframe_image, image, self.keyframe_corners, None)
+            found = status.reshape(-1) == 1
+            if found.sum() >= max(self.min_corners, self.min_found_fraction * len(found)):
+                flow = (corners - self.keyframe_corners).reshape(-1, 2)[found]
+                camera_shift = np.median(flow, axis=0)
+                shift = np.hypot(*camera_shift) / scale
+                deviation = np.median(np.hypot(*(flow - camera_shift).T)) / scale
+                if shift <= self.max_shift and deviation <= self.max_shift:
+                    self.frames_since_keyframe += 1
+                    return False
+
+        self.keyframe_image = image
+        self.keyframe_corners = cv2.goodFeaturesToTrack(image, maxCorners=200, qualityLevel=0.01, minDistance=5)
+        self.frames_since_keyframe = 1
+        return True
+
+    def get_keyframe_report(self):
+        """
+        Summarize how often the model ran in keyframe mode.
+
+        Returns:
+            dict: Frames run through the model ('keyframe') and propagated ('propagated'),
+                and the fraction of frames that skipped the model ('propagated_fraction').
+        """
+        report = dict(self.keyframe_counts)
+        total = report['keyframe'] + report['propagated']
+        report['propagated_fraction'] = report['propagated'] / total if total else 0.0
+        return report
+
     def get_court_keypoints(self, frames,read_from_stub=False, stub_path=None):
         """
         Detect court keypoints for a batch of frames using the YOLO model. If requested, 
         attempts to read previously detected keypoints from a stub file before running the model.
 
         Args:
-            frames (list of numpy.ndarray): A list of frames (images) on which to detect keypoints.
+            frames (list or VideoFrameSource): The frames (images) on which to detect keypoints.
+                Frames are consumed in batches, so a VideoFrameSource is never fully loaded.
             read_from_stub (bool, optional): Indicates whether to read keypoints from a stub file 
                 instead of running the detection model. Defaults to False.
             stub_path (str, optional): The file path for the stub file. If None, a default path may be used. 
@@ -30,15 +165,13 @@ class CourtKeypointDetector:
         """
         court_keypoints = read_stub(read_from_stub,stub_path)
         if court_keypoints is not None:
-            if len(court_keypoints) == len(frames):
+            if stub_matches_frames(court_keypoints,frames):
                 return court_keypoints
         
-        batch_size=20
+        self.reset()
         court_keypoints = []
-        for i in range(0,len(frames),batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size],conf=0.5)
-            for detection in detections_batch:
-                court_keypoints.append(detection.keypoints)
+        for batch in iter_frame_batches(frames,self.batch_size):
+            court_keypoints += self.detect_keypoints(batch.frames)
 
         save_stub(stub_path,court_keypoints)
         
@@ -1,5 +1,6 @@
 import numpy as np
 import cv2 
+from typing import Optional
 
 class Homography:
     def __init__(self, source: np.ndarray, target: np.ndarray) -> None:
@@ -23,4 +24,110 @@ class Homography:
         
         points = points.reshape(-1, 1, 2).astype(np.float32)
         points = cv2.perspectiveTransform(points, self.m)
-        return points.reshape(-1, 2).astype(np.float32)
\ No newline at end of file
+        return points.reshape(-1, 2).astype(np.float32)
+
+
+class HomographyCache:
+    """
+    Reuses and smooths the homography of a mostly static broadcast camera.
+
+    The keypoints the current homography was fitted on are kept as a reference. A frame
+    whose keypoints moved less than reuse_threshold pixels from them, measured as the
+    mean shift of the keypoints detected in both, gets the same Homography object back
+    without calling cv2.findHomography. The mean shift follows pans while the
+    detector's per-point jitter largely cancels out; the mean per-point distance is
+    also bounded by max_point_distance so zooms, which leave the mean shift near zero,
+    still trigger a new fit.
+
+    While the camera holds still the keypoints of every frame are averaged, and every
+    refit_interval reused frames the homography is refitted on that average. Static
+    shots thus converge to a homography free of detector jitter instead of keeping the
+    noise of the single frame they started from.
+    """
+    def __init__(self,
+                 reuse_threshold: float = 1.0,
+                 max_point_distance: float = 6.0,
+                 refit_interval: int = 25,
+                 min_points: int = 4,
+                 ) -> None:
+        self.reuse_threshold = reuse_threshold
+        self.max_point_distance = max_point_distance
+        self.refit_interval = refit_interval
+        self.min_points = min_points
+        self.reset()
+
+    def reset(self) -> None:
+        self.homography = None
+        self.reference_points = None
+        self.reference_valid = None
+        # per-keypoint sums over the frames since the camera last moved
+        self.point_sums = None
+        self.point_counts = None
+        self.hits_since_fit = 0
+        self.stats = {'hits': 0, 'fits': 0, 'refits': 0, 'failures': 0, 'skipped': 0}
+
+    def get(self, source: np.ndarray, target: np.ndarray) -> Optional["Homography"]:
+        """
+        Get the homography of a frame.
+
+        source holds every keypoint of the frame, (0, 0) when not detected, and target the
+        matching tactical view points. Returns None when no homography can be fitted.
+        """
+        source = np.asarray(source, dtype=np.float64)
+        target = np.asarray(target, dtype=np.float64)
+        valid = (source[:, 0] > 0) & (source[:, 1] > 0)
+        if valid.sum() < self.min_points:
+            self.stats['skipped'] += 1
+            return None
+
+        if not self.is_still(source, valid):
+            homography = self.fit(source, valid, target)
+            if homography is None:
+                self.stats['failures'] += 1
+                return None
+            self.stats['fits'] += 1
+            self.homography = homography
+            self.point_sums = np.where(valid[:, None], source, 0.)
+            self.point_counts = valid.astype(np.int64)
+            self.hits_since_fit = 0
+            return self.homography
+
+        self.stats['hits'] += 1
+        self.point_sums[valid] += source[valid]
+        self.point_counts += valid
+        self.hits_since_fit += 1
+        if self.hits_since_fit >= self.refit_interval:
+            averaged_valid = self.point_counts > 0
+            averaged = np.zeros_like(source)
+            averaged[averaged_valid] = self.point_sums[averaged_valid] / self.point_counts[averaged_valid, None]
+            homography = self.fit(averaged, averaged_valid, target)
+            if homography is not None:
+                self.stats['refits'] += 1
+                self.homography = homography
+            self.hits_since_fit = 0
+        return self.homography
+
+    def fit(self, source: np.ndarray, valid: np.ndarray, target: np.ndarray) -> Optional["Homography"]:
+        try:
+            homography = Homography(source[valid], target[valid])
+        except (ValueError, cv2.error):
+            return None
+        self.reference_points = source
+        self.reference_valid = valid
+        return homography
+
+    def is_still(self, source: np.ndarray, valid: np.ndarray) -> bool:
+        if self.homography is None:
+            return False
+        common = valid & self.reference_valid
+        if common.sum() < self.min_points:
+            return False
+        shifts = source[common] - self.reference_points[common]
+        return (np.linalg.norm(shifts.mean(axis=0)) < self.reuse_threshold
+                and np.linalg.norm(shifts, axis=1).mean() < self.max_point_distance)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        lookups = stats['hits'] + stats['fits'] + stats['failures']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -3,16 +3,17 @@ import sys
 import pathlib
 import numpy as np
 import cv2
-from copy import deepcopy
 from .homography import Homography
 
 folder_path = pathlib.Path(__file__).parent.resolve()
 sys.path.append(os.path.join(folder_path,"../"))
-from utils import get_foot_position,measure_distance
+from utils import TrackTable,PositionTable
 
 class TacticalViewConverter:
-    def __init__(self, court_image_path):
+    def __init__(self, court_image_path, homography_cache=None):
         self.court_image_path = court_image_path
+        # optional HomographyCache reusing homographies across frames
+        self.homography_cache = homography_cache
         self.width = 300
         self.height= 161
 
@@ -49,134 +50,198 @@ class TacticalViewConverter:
             (int(((self.actual_width_in_meters-5.79)/self.actual_width_in_meters)*self.width),int((10/self.actual_height_in_meters)*self.height)),
         ]
 
+        # distances between every pair of tactical keypoints, for validate_keypoints
+        key_points = np.array(self.key_points, dtype=np.float64)
+        self.key_point_distances = np.sqrt(((key_points[:, None, :] - key_points[None, :, :]) ** 2).sum(axis=2))
+
+    def get_keypoint_array(self, keypoints_list):
+        """
+        Stack the detected court keypoints of every frame into one array.
+
+        Args:
+            keypoints_list (list or numpy.ndarray): Detected keypoints of each frame, as
+                returned by CourtKeypointDetector, or an array that is returned as is.
+
+        Returns:
+            numpy.ndarray: Keypoints (x, y) of shape (N_frames, 18, 2), float32. Keypoints
+                that were not detected, and frames without a detection, are (0, 0).
+        """
+        if isinstance(keypoints_list, np.ndarray):
+            return keypoints_list
+        keypoints = np.zeros((len(keypoints_list), len(self.key_points), 2), dtype=np.float32)
+        for frame_idx, frame_keypoints in enumerate(keypoints_list):
+            if frame_keypoints is not None and len(frame_keypoints.xy) > 0:
+                keypoints[frame_idx] = frame_keypoints.xy.tolist()[0]
+        return keypoints
+
     def validate_keypoints(self, keypoints_list):
         """
         Validates detected keypoints by comparing their proportional distances
         to the tactical view keypoints.
-        
+
+        For each detected keypoint i of a frame, the first two other detected keypoints j
+        and k not already found invalid are taken, and the keypoint is invalid when the
+        ratio of its detected distances to them differs by more than 80% from the ratio of
+        the tactical distances. Keypoints are visited in index order, one index at a time
+        for all frames at once. Frames with fewer than 3 detected keypoints are left as they are.
+
         Args:
-            keypoints_list (List[List[Tuple[float, float]]]): A list containing keypoints for each frame.
-                Each outer list represents a frame.
-                Each inner list contains keypoints as (x, y) tuples.
+            keypoints_list (list or numpy.ndarray): Detected keypoints of each frame, as
+                returned by CourtKeypointDetector, or an array of shape (N_frames, 18, 2).
                 A keypoint of (0, 0) indicates that the keypoint is not detected for that frame.
-        
+
         Returns:
-            List[bool]: A list indicating whether each frame's keypoints are valid.
+            tuple: (keypoints, valid) where keypoints is the (N_frames, 18, 2) array of
+                detected keypoints and valid a boolean array of shape (N_frames, 18), True
+                for keypoints that were detected and passed validation.
         """
+        keypoints = self.get_keypoint_array(keypoints_list)
+        points = keypoints.astype(np.float64)
+        detected = (points[:, :, 0] > 0) & (points[:, :, 1] > 0)
+        # Need at least 3 detected keypoints to validate proportions
+        checked_frames = detected.sum(axis=1) >= 3
+        invalid = np.zeros_like(detected)
+        frames = np.arange(len(points))
+
+        for i in range(len(self.key_points)):
+            # first two other detected keypoints not found invalid so far
+            others = detected & ~invalid
+            others[:, i] = False
+            others_count = np.cumsum(others, axis=1)
+            checked = checked_frames & detected[:, i] & (others_count[:, -1] >= 2)
+            if not checked.any():
+                continue
+            j = np.argmax(others_count >= 1, axis=1)
+            k = np.argmax(others_count >= 2, axis=1)
 
-        keypoints_list = deepcopy(keypoints_list)
+            # Calculate distances between detected keypoints
+            d_ij = np.sqrt(((points[:, i] - points[frames, j]) ** 2).sum(axis=1))
+            d_ik = np.sqrt(((points[:, i] - points[frames, k]) ** 2).sum(axis=1))
+            t_ij = self.key_point_distances[i, j]
+            t_ik = self.key_point_distances[i, k]
 
-        for frame_idx, frame_keypoints in enumerate(keypoints_list):
-            frame_keypoints = frame_keypoints.xy.tolist()[0]
-            
-            # Get indices of detected keypoints (not (0, 0))
-            detected_indices = [i for i, kp in enumerate(frame_keypoints) if kp[0] >0 and kp[1]>0]
-            
-            # Need at least 3 detected keypoints to validate proportions
-            if len(detected_indices) < 3:
-                continue
-            
-            invalid_keypoints = []
-            # Validate each detected keypoint
-            for i in detected_indices:
-                # Skip if this is (0, 0)
-                if frame_keypoints[i][0] == 0 and frame_keypoints[i][1] == 0:
-                    continue
-
-                # Choose two other random detected keypoints
-                other_indices = [idx for idx in detected_indices if idx != i and idx not in invalid_keypoints]
-                if len(other_indices) < 2:
-                    continue
-
-                # Take first two other indices for simplicity
-                j, k = other_indices[0], other_indices[1]
-
-                # Calculate distances between detected keypoints
-                d_ij = measure_distance(frame_keypoints[i], frame_keypoints[j])
-                d_ik = measure_distance(frame_keypoints[i], frame_keypoints[k])
-                
-                # Calculate distances between corresponding tactical keypoints
-                t_ij = measure_distance(self.key_points[i], self.key_points[j])
-                t_ik = measure_distance(self.key_points[i], self.key_points[k])
-
-                # Calculate and compare proportions with 50% error margin
-                if t_ij > 0 and t_ik > 0:
-                    prop_detected = d_ij / d_ik if d_ik > 0 else float('inf')
-                    prop_tactical = t_ij / t_ik if t_ik > 0 else float('inf')
-
-                    error = (prop_detected - prop_tactical) / prop_tactical
-                    error = abs(error)
-
-                    if error >0.8:  # 80% error margin                        
-                        keypoints_list[frame_idx].xy[0][i] *= 0
-                        keypoints_list[frame_idx].xyn[0][i] *= 0
-                        invalid_keypoints.append(i)
-            
-        return keypoints_list
+            # Calculate and compare proportions with 80% error margin
+            with np.errstate(divide='ignore', invalid='ignore'):
+                prop_detected = np.where(d_ik > 0, d_ij / d_ik, np.inf)
+                prop_tactical = t_ij / t_ik
+                error = np.abs((prop_detected - prop_tactical) / prop_tactical)
+            invalid[:, i] = checked & (t_ij > 0) & (t_ik > 0) & (error > 0.8)
+
+        return keypoints, detected & ~invalid
+
+    def get_homography(self, frame_keypoints, valid=None):
+        """
+        Compute the homography from a frame's detected court keypoints to the tactical view.
+
+        With a homography cache, frames whose keypoints barely moved get the previous
+        Homography object back, and still shots are refitted on averaged keypoints.
 
-    def transform_players_to_tactical_view(self, keypoints_list, player_tracks):
+        Args:
+            frame_keypoints: Detected court keypoints of the frame, or their (18, 2) array.
+            valid (numpy.ndarray): Optional boolean mask of shape (18,) from
+                validate_keypoints. Keypoints outside it are treated as not detected.
+
+        Returns:
+            Homography: The frame's homography, or None when fewer than 4 keypoints were
+                detected or no homography could be fitted.
+        """
+        if isinstance(frame_keypoints, np.ndarray):
+            detected_keypoints = frame_keypoints
+        elif frame_keypoints is None or len(frame_keypoints.xy) == 0:
+            return None
+        else:
+            detected_keypoints = frame_keypoints.xy.tolist()[0]
+        if valid is not None:
+            detected_keypoints = np.where(np.asarray(valid)[:, None], detected_keypoints, 0.0)
+        detected_keypoints = np.asarray(detected_keypoints, dtype=np.float32).tolist()
+
+        if self.homography_cache is not None:
+            return self.homography_cache.get(detected_keypoints, self.key_points)
+
+        # Filter out undetected keypoints (those with coordinates (0,0))
+        valid_indices = [i for i, kp in enumerate(detected_keypoints) if kp[0] > 0 and kp[1] > 0]
+
+        # Need at least 4 points for a reliable homography
+        if len(valid_indices) < 4:
+            return None
+
+        # Create source and target point arrays for homography
+        source_points = np.array([detected_keypoints[i] for i in valid_indices], dtype=np.float32)
+        target_points = np.array([self.key_points[i] for i in valid_indices], dtype=np.float32)
+
+        try:
+            return Homography(source_points, target_points)
+        except (ValueError, cv2.error):
+            return None
+
+    def transform_players_to_tactical_table(self, keypoints_list, player_tracks, keypoint_mask=None):
+        """
+        Transform player positions to tactical view coordinates, in columnar form.
+
+        The foot positions of every player of a frame are transformed in one call, and
+        consecutive frames sharing the same homography are transformed together. Players
+        landing outside the tactical view are dropped with a mask. The homography cache,
+        if any, is reset first so each video starts from its own keypoints.
+
+        Args:
+            keypoints_list (list or numpy.ndarray): Detected court keypoints of each frame,
+                or their (N_frames, 18, 2) array.
+            player_tracks (list or TrackTable): Player tracks of each frame.
+            keypoint_mask (numpy.ndarray): Optional (N_frames, 18) validity mask from
+                validate_keypoints.
+
+        Returns:
+            PositionTable: Tactical view (x, y) position of each player and frame, covering
+                min(len(keypoints_list), len(player_tracks)) frames.
+        """
+        if not isinstance(player_tracks, TrackTable):
+            player_tracks = TrackTable.from_frame_dicts(player_tracks, bbox_dtype=np.float64)
+        num_frames = min(len(keypoints_list), player_tracks.frame_count)
+
+        # bottom center of each bounding box, truncated like get_foot_position
+        bboxes = player_tracks.bbox.astype(np.float64)
+        foot_positions = np.column_stack((np.trunc((bboxes[:, 0] + bboxes[:, 2]) / 2), np.trunc(bboxes[:, 3])))
+
+        if self.homography_cache is not None:
+            self.homography_cache.reset()
+        homographies = [self.get_homography(keypoints_list[frame_num], None if keypoint_mask is None else keypoint_mask[frame_num])
+                        for frame_num in range(num_frames)]
+        positions = np.zeros((len(player_tracks), 2), dtype=np.float32)
+        transformed = np.zeros(len(player_tracks), dtype=bool)
+        start = 0
+        while start < num_frames:
+            end = start + 1
+            while end < num_frames and homographies[end] is homographies[start]:
+                end += 1
+            if homographies[start] is not None:
+                rows = slice(int(player_tracks.frame_offsets[start]), int(player_tracks.frame_offsets[end]))
+                positions[rows] = homographies[start].transform_points(foot_positions[rows])
+                transformed[rows] = True
+            start = end
+
+        # If tactical position is not in the tactical view, skip
+        keep = (transformed
+                & (positions[:, 0] >= 0) & (positions[:, 0] <= self.width)
+                & (positions[:, 1] >= 0) & (positions[:, 1] <= self.height))
+        return PositionTable(player_tracks.frame_index[keep],
+                             player_tracks.track_id[keep],
+                             positions[keep],
+                             frame_count=num_frames)
+
+    def transform_players_to_tactical_view(self, keypoints_list, player_tracks, keypoint_mask=None):
         """
         Transform player positions from video frame coordinates to tactical view coordinates.
         
         Args:
-            keypoints_list (list): List of detected court keypoints for each frame.
+            keypoints_list (list or numpy.ndarray): Detected court keypoints of each frame,
+                or their (N_frames, 18, 2) array.
             player_tracks (list): List of dictionaries containing player tracking information for each frame,
                 where each dictionary maps player IDs to their bounding box coordinates.
+            keypoint_mask (numpy.ndarray): Optional (N_frames, 18) validity mask from
+                validate_keypoints.
         
         Returns:
             list: List of dictionaries where each dictionary maps player IDs to their (x, y) positions
                 in the tactical view coordinate system. The list index corresponds to the frame number.
         """
-        tactical_player_positions = []
-        
-        for frame_idx, (frame_keypoints, frame_tracks) in enumerate(zip(keypoints_list, player_tracks)):
-            # Initialize empty dictionary for this frame
-            tactical_positions = {}
-
-            frame_keypoints = frame_keypoints.xy.tolist()[0]
-
-            # Skip frames with insufficient keypoints
-            if frame_keypoints is None or len(frame_keypoints) == 0:
-                tactical_player_positions.append(tactical_positions)
-                continue
-            
-            # Get detected keypoints for this frame
-            detected_keypoints = frame_keypoints
-            
-            # Filter out undetected keypoints (those with coordinates (0,0))
-            valid_indices = [i for i, kp in enumerate(detected_keypoints) if kp[0] > 0 and kp[1] > 0]
-            
-            # Need at least 4 points for a reliable homography
-            if len(valid_indices) < 4:
-                tactical_player_positions.append(tactical_positions)
-                continue
-            
-            # Create source and target point arrays for homography
-            source_points = np.array([detected_keypoints[i] for i in valid_indices], dtype=np.float32)
-            target_points = np.array([self.key_points[i] for i in valid_indices], dtype=np.float32)
-            
-            try:
-                # Create homography transformer
-                homography = Homography(source_points, target_points)
-                
-                # Transform each player's position
-                for player_id, player_data in frame_tracks.items():
-                    bbox = player_data["bbox"]
-                    # Use bottom center of bounding box as player position
-                    player_position = np.array([get_foot_position(bbox)])
-                    # Transform to tactical view coordinates
-                    tactical_position = homography.transform_points(player_position)
-
-                    # If tactical position is not in the tactical view, skip
-                    if tactical_position[0][0] < 0 or tactical_position[0][0] > self.width or tactical_position[0][1] < 0 or tactical_position[0][1] > self.height:
-                        continue
-
-                    tactical_positions[player_id] = tactical_position[0].tolist()
-                    
-            except (ValueError, cv2.error) as e:
-                # If homography fails, continue with empty dictionary
-                pass
-            
-            tactical_player_positions.append(tactical_positions)
-        
-        return tactical_player_positions
\ No newline at end of file
+        return self.transform_players_to_tactical_table(keypoints_list, player_tracks, keypoint_mask).to_frame_dicts()
@@ -1,10 +1,12 @@
 from PIL import Image
 import cv2
+import numpy as np
+import torch
 from transformers import CLIPProcessor, CLIPModel
 
-import sys 
+import sys
 sys.path.append('../')
-from utils import read_stub, save_stub
+from utils import read_stub, save_stub, iter_frame_batches, stub_matches_frames
 
 class TeamAssigner:
     """
@@ -13,15 +15,60 @@ class TeamAssigner:
     The class uses a pre-trained vision model to classify players into teams based on their
     appearance. It maintains a consistent team assignment for each player across frames.
 
+    The team prompts are encoded once, and player crops are classified in batches: crops
+    of every player that needs a team are collected over a window of frames and embedded
+    together, and the frames of the window are resolved once the window closes.
+
+    Two assignment modes are supported. In "window" mode every player is re-classified
+    from a single crop in every window. In "track" mode a handful of good-quality crops
+    are sampled per track ID and their probabilities are averaged into one decision that
+    is kept for the life of the track; the track is only re-sampled when its torso color
+    histogram drifts away from the one it was classified with.
+
+    Optionally, crops are first classified by comparing their torso color histogram with
+    a color prototype of each team, learned from crops that CLIP classified confidently.
+    Only crops whose color classification is uncertain are sent to CLIP.
+
     Attributes:
-        team_colors (dict): Dictionary storing team color information.
+        team_colors (dict): Dictionary mapping team IDs to their torso color prototype
+            ('histogram') and the number of crops it was learned from ('count').
+        classification_counts (dict): Number of crops classified by the color
+            histogram ('histogram') and by CLIP ('clip').
         player_team_dict (dict): Dictionary mapping player IDs to their team assignments.
         team_1_class_name (str): Description of Team 1's jersey appearance.
         team_2_class_name (str): Description of Team 2's jersey appearance.
+        window_size (int): Number of frames after which team assignments are recomputed,
+            or resolved in "track" mode.
+        clip_batch_size (int): Maximum number of crops embedded in one forward pass.
+        assignment_mode (str): "window" or "track".
+        votes_per_track (int): Number of crops sampled per track in "track" mode.
+        sample_interval (int): Minimum number of frames between two samples of a track.
+        drift_threshold (float): Bhattacharyya distance between torso histograms above
+            which a track is re-sampled.
+        drift_check_interval (int): Number of frames between two drift checks of a track.
+        min_crop_height (int): Minimum bounding box height in pixels of a sampled crop.
+        max_crop_overlap (float): Maximum fraction of a sampled crop covered by other players.
+        use_color_classifier (bool): Whether to try the color histogram before CLIP.
+        color_uncertainty_threshold (float): Color classifications with a higher
+            uncertainty are sent to CLIP.
+        min_color_samples (int): Number of CLIP-labelled crops per team needed before
+            the color classifier is used.
     """
     def __init__(self,
                  team_1_class_name= "white shirt",
                  team_2_class_name= "dark blue shirt",
+                 window_size=50,
+                 clip_batch_size=32,
+                 assignment_mode="window",
+                 votes_per_track=5,
+                 sample_interval=5,
+                 drift_threshold=0.5,
+                 drift_check_interval=10,
+                 min_crop_height=40,
+                 max_crop_overlap=0.2,
+                 use_color_classifier=False,
+                 color_uncertainty_threshold=0.6,
+                 min_color_samples=5,
                  ):
         """
         Initialize the TeamAssigner with specified team jersey descriptions.
@@ -29,50 +76,354 @@ class TeamAssigner:
         Args:
             team_1_class_name (str): Description of Team 1's jersey appearance.
             team_2_class_name (str): Description of Team 2's jersey appearance.
+            window_size (int): Number of frames after which team assignments are recomputed.
+            clip_batch_size (int): Maximum number of crops embedded in one forward pass.
+            assignment_mode (str): "window" to re-classify every player each window, or
+                "track" to vote once per track ID.
+            votes_per_track (int): Number of crops sampled per track in "track" mode.
+            sample_interval (int): Minimum number of frames between two samples of a track.
+            drift_threshold (float): Torso histogram distance that triggers re-sampling.
+            drift_check_interval (int): Number of frames between two drift checks of a track.
+            min_crop_height (int): Minimum bounding box height in pixels of a sampled crop.
+            max_crop_overlap (float): Maximum fraction of a sampled crop covered by other players.
+            use_color_classifier (bool): Whether to try the color histogram before CLIP.
+            color_uncertainty_threshold (float): Color classifications with a higher
+                uncertainty (between 0 and 1) are sent to CLIP.
+            min_color_samples (int): Number of CLIP-labelled crops per team needed before
+                the color classifier is used.
         """
-        self.team_colors = {}
-        self.player_team_dict = {}        
-    
+        if assignment_mode not in ("window", "track"):
+            raise ValueError(f"Unknown assignment mode {assignment_mode}.")
+
         self.team_1_class_name = team_1_class_name
         self.team_2_class_name = team_2_class_name
+        self.batch_size = 20
+        self.window_size = window_size
+        self.clip_batch_size = clip_batch_size
+        self.assignment_mode = assignment_mode
+        self.votes_per_track = votes_per_track
+        self.sample_interval = sample_interval
+        self.drift_threshold = drift_threshold
+        self.drift_check_interval = drift_check_interval
+        self.min_crop_height = min_crop_height
+        self.max_crop_overlap = max_crop_overlap
+        self.use_color_classifier = use_color_classifier
+        self.color_uncertainty_threshold = color_uncertainty_threshold
+        self.min_color_samples = min_color_samples
+
+        self.text_embeddings = None
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the team cache and any frames still waiting for classification.
+        """
+        self.player_team_dict = {}
+        self.current_window = None
+        self.pending_crops = {}
+        self.pending_frames = []
+        self.track_states = {}
+        self.team_colors = {}
+        self.classification_counts = {'histogram': 0, 'clip': 0}
 
     def load_model(self):
         """
-        Loads the pre-trained vision model for jersey color classification.
+        Loads the pre-trained vision model for jersey color classification and
+        encodes the team prompts.
         """
         self.model = CLIPModel.from_pretrained("patrickjohncyh/fashion-clip")
         self.processor = CLIPProcessor.from_pretrained("patrickjohncyh/fashion-clip")
+        self.model.eval()
+        self.text_embeddings = self.encode_team_prompts()
 
-    def get_player_color(self,frame,bbox):
+    def encode_team_prompts(self):
         """
-        Analyzes the jersey color of a player within the given bounding box.
+        Encodes the two team descriptions with the CLIP text encoder.
+
+        Returns:
+            torch.Tensor: L2-normalized text embeddings of shape (2, embedding_dim).
+        """
+        classes = [self.team_1_class_name, self.team_2_class_name]
+        inputs = self.processor(text=classes, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            text_embeddings = self.model.get_text_features(**inputs)
+        return text_embeddings / text_embeddings.norm(dim=-1, keepdim=True)
+
+    def get_player_crop(self,frame,bbox):
+        """
+        Crops a player from a frame as an RGB image.
 
         Args:
             frame (numpy.ndarray): The video frame containing the player.
             bbox (tuple): Bounding box coordinates of the player.
 
         Returns:
-            str: The classified jersey color/description.
+            PIL.Image.Image: The cropped player.
         """
         image = frame[int(bbox[1]):int(bbox[3]),int(bbox[0]):int(bbox[2])]
 
         # Convert to PIL Image
         rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image)
-        image = pil_image
+        return Image.fromarray(rgb_image)
+
+    def get_torso_region(self,frame,bbox):
+        """
+        Extracts the torso of a player, where the jersey color is most visible.
+
+        Args:
+            frame (numpy.ndarray): The video frame containing the player.
+            bbox (tuple): Bounding box coordinates of the player.
+
+        Returns:
+            numpy.ndarray: The BGR torso region, or None if it is empty.
+        """
+        x1, y1, x2, y2 = bbox
+        width = x2 - x1
+        height = y2 - y1
+        torso = frame[max(int(y1 + 0.15*height),0):max(int(y1 + 0.5*height),0),
+                      max(int(x1 + 0.2*width),0):max(int(x2 - 0.2*width),0)]
+        if torso.size == 0:
+            return None
+        return torso
+
+    def get_appearance_signature(self,frame,bbox):
+        """
+        Computes a normalized HSV color histogram of a player's torso.
+
+        Args:
+            frame (numpy.ndarray): The video frame containing the player.
+            bbox (tuple): Bounding box coordinates of the player.
+
+        Returns:
+            numpy.ndarray: The flattened float32 histogram, or None if the torso is empty.
+        """
+        torso = self.get_torso_region(frame,bbox)
+        if torso is None:
+            return None
+        hsv = cv2.cvtColor(torso, cv2.COLOR_BGR2HSV)
+        histogram = cv2.calcHist([hsv],[0,1,2],None,[8,4,4],[0,180,0,256,0,256])
+        cv2.normalize(histogram,histogram)
+        return histogram.flatten()
+
+    def get_color_signature(self,frame,bbox):
+        """
+        Computes the torso color signature used by the color classifier.
+
+        Args:
+            frame (numpy.ndarray): The video frame containing the player.
+            bbox (tuple): Bounding box coordinates of the player.
+
+        Returns:
+            numpy.ndarray: The signature, or None when the color classifier is disabled.
+        """
+        if not self.use_color_classifier:
+            return None
+        return self.get_appearance_signature(frame,bbox)
+
+    def is_good_crop(self,player_id,bbox,frame_bboxes):
+        """
+        Checks whether a player crop is reliable enough to vote on the team.
+
+        Small, oddly shaped or occluded crops are rejected.
+
+        Args:
+            player_id (int): Identifier of the player.
+            bbox (tuple): Bounding box coordinates of the player.
+            frame_bboxes (dict): Bounding boxes of every player in the frame.
+
+        Returns:
+            bool: True if the crop can be sampled.
+        """
+        x1, y1, x2, y2 = bbox
+        width = x2 - x1
+        height = y2 - y1
+        if width <= 0 or height < self.min_crop_height:
+            return False
+        if not 1.0 <= height / width <= 5.0:
+            return False
+
+        area = width * height
+        for other_id, other_bbox in frame_bboxes.items():
+            if other_id == player_id:
+                continue
+            overlap_width = min(x2, other_bbox[2]) - max(x1, other_bbox[0])
+            overlap_height = min(y2, other_bbox[3]) - max(y1, other_bbox[1])
+            if overlap_width > 0 and overlap_height > 0 and overlap_width * overlap_height / area > self.max_crop_overlap:
+                return False
+        return True
+
+    def get_team_probabilities(self,crops,signatures=None):
+        """
+        Computes team probabilities for a list of player crops.
+
+        When the color classifier is enabled and torso signatures are given, each crop is
+        first classified by color; crops with an uncertain color classification, and all
+        crops until both team color prototypes are learned, are classified by CLIP.
+
+        Args:
+            crops (list of PIL.Image.Image): Player crops to classify.
+            signatures (list of numpy.ndarray): Torso color signature of each crop, as
+                returned by get_appearance_signature.
+
+        Returns:
+            numpy.ndarray: Probabilities of shape (len(crops), 2) for Team 1 and Team 2.
+        """
+        if not self.use_color_classifier or signatures is None:
+            self.classification_counts['clip'] += len(crops)
+            return self.get_clip_probabilities(crops)
+
+        probabilities = np.zeros((len(crops),2))
+        clip_indices = []
+        for i, signature in enumerate(signatures):
+            color_probabilities, uncertainty = self.classify_by_color(signature)
+            if color_probabilities is None or uncertainty > self.color_uncertainty_threshold:
+                clip_indices.append(i)
+            else:
+                probabilities[i] = color_probabilities
+        self.classification_counts['histogram'] += len(crops) - len(clip_indices)
+
+        if clip_indices:
+            clip_probabilities = self.get_clip_probabilities([crops[i] for i in clip_indices])
+            self.classification_counts['clip'] += len(clip_indices)
+            for i, crop_probabilities in zip(clip_indices, clip_probabilities):
+                probabilities[i] = crop_probabilities
+                self.update_team_colors(signatures[i],crop_probabilities)
+
+        return probabilities
+
+    def classify_by_color(self,signature):
+        """
+        Classifies a torso color signature against the team color prototypes.
+
+        The uncertainty is 1 minus the relative difference of the Bhattacharyya distances
+        to the two prototypes: 0 when the crop is far closer to one team, 1 when it is
+        equally close to both.
+
+        Args:
+            signature (numpy.ndarray): Torso color signature of the crop.
+
+        Returns:
+            tuple: (probabilities, uncertainty), or (None, 1.0) if the prototypes are not
+                learned yet or the signature is missing.
+        """
+        if signature is None:
+            return None, 1.0
+        for team_id in (1,2):
+            if self.team_colors.get(team_id,{}).get('count',0) < self.min_color_samples:
+                return None, 1.0
+
+        distance_1 = cv2.compareHist(self.team_colors[1]['histogram'],signature,cv2.HISTCMP_BHATTACHARYYA)
+        distance_2 = cv2.compareHist(self.team_colors[2]['histogram'],signature,cv2.HISTCMP_BHATTACHARYYA)
+        confidence = abs(distance_1 - distance_2) / max(distance_1, distance_2, 1e-6)
+        closer = 0.5 + confidence / 2
+        if distance_1 <= distance_2:
+            return np.array([closer, 1 - closer]), 1 - confidence
+        return np.array([1 - closer, closer]), 1 - confidence
+
+    def update_team_colors(self,signature,probabilities,min_probability=0.75):
+        """
+        Adds a confidently classified crop to its team's color prototype.
+
+        Args:
+            signature (numpy.ndarray): Torso color signature of the crop.
+            probabilities (numpy.ndarray): Team probabilities of the crop.
+            min_probability (float): Minimum probability for the crop to be used.
+        """
+        if signature is None or max(probabilities) < min_probability:
+            return
+        team_id = int(np.argmax(probabilities)) + 1
+        team_color = self.team_colors.setdefault(team_id, {'histogram': np.zeros_like(signature), 'count': 0})
+        team_color['count'] += 1
+        team_color['histogram'] = team_color['histogram'] + (signature - team_color['histogram']) / team_color['count']
+
+    def get_classification_report(self):
+        """
+        Summarizes how many crops were classified by each path.
+
+        Returns:
+            dict: Crop counts per path ('histogram', 'clip'), their total and the
+                fraction of crops that needed CLIP.
+        """
+        total = self.classification_counts['histogram'] + self.classification_counts['clip']
+        return {
+            'histogram': self.classification_counts['histogram'],
+            'clip': self.classification_counts['clip'],
+            'total': total,
+            'clip_fraction': self.classification_counts['clip'] / total if total else 0.0,
+        }
+
+    def get_clip_probabilities(self,crops):
+        """
+        Computes CLIP team probabilities for a list of player crops in batches.
+
+        The image embeddings are compared to the cached prompt embeddings exactly as the
+        CLIP forward pass does, so the text encoder runs only once per assigner.
+
+        Args:
+            crops (list of PIL.Image.Image): Player crops to classify.
+
+        Returns:
+            numpy.ndarray: Probabilities of shape (len(crops), 2) for Team 1 and Team 2.
+        """
+        if self.text_embeddings is None:
+            self.text_embeddings = self.encode_team_prompts()
+
+        probabilities = []
+        logit_scale = self.model.logit_scale.exp()
+        for i in range(0,len(crops),self.clip_batch_size):
+            inputs = self.processor(images=crops[i:i+self.clip_batch_size], return_tensors="pt")
+            with torch.no_grad():
+                image_embeddings = self.model.get_image_features(**inputs)
+            image_embeddings = image_embeddings / image_embeddings.norm(dim=-1, keepdim=True)
+            logits_per_image = logit_scale * image_embeddings @ self.text_embeddings.t()
+            probabilities.append(logits_per_image.softmax(dim=1))
+
+        if not probabilities:
+            return np.zeros((0,2))
+        return torch.cat(probabilities).numpy()
+
+    def classify_crops(self,crops,signatures=None):
+        """
+        Classifies a list of player crops into team descriptions.
 
+        Args:
+            crops (list of PIL.Image.Image): Player crops to classify.
+            signatures (list of numpy.ndarray): Optional torso color signature of each crop.
+
+        Returns:
+            list of str: The classified jersey description of each crop.
+        """
         classes = [self.team_1_class_name, self.team_2_class_name]
+        probs = self.get_team_probabilities(crops,signatures)
+        return [classes[index] for index in probs.argmax(axis=1).tolist()]
 
-        inputs = self.processor(text=classes, images=image, return_tensors="pt", padding=True)
+    def get_player_color(self,frame,bbox):
+        """
+        Analyzes the jersey color of a player within the given bounding box.
 
-        outputs = self.model(**inputs)
-        logits_per_image = outputs.logits_per_image
-        probs = logits_per_image.softmax(dim=1) 
+        Args:
+            frame (numpy.ndarray): The video frame containing the player.
+            bbox (tuple): Bounding box coordinates of the player.
 
+        Returns:
+            str: The classified jersey color/description.
+        """
+        return self.classify_crops([self.get_player_crop(frame,bbox)],[self.get_color_signature(frame,bbox)])[0]
 
-        class_name=  classes[probs.argmax(dim=1)[0]]
+    def get_team_id(self,player_color):
+        """
+        Maps a jersey description to its team ID.
 
-        return class_name
+        Args:
+            player_color (str): The classified jersey description.
+
+        Returns:
+            int: Team ID (1 or 2).
+        """
+        team_id=2
+        if player_color==self.team_1_class_name:
+            team_id=1
+        return team_id
 
     def get_player_team(self,frame,player_bbox,player_id):
         """
@@ -91,19 +442,240 @@ class TeamAssigner:
 
         player_color = self.get_player_color(frame,player_bbox)
 
-        team_id=2
-        if player_color==self.team_1_class_name:
-            team_id=1
+        team_id = self.get_team_id(player_color)
 
         self.player_team_dict[player_id] = team_id
         return team_id
 
+    def add_frame(self,frame_num,frame,player_track):
+        """
+        Queues the players of a frame for team assignment.
+
+        When a frame from a new window arrives, the pending crops are classified in
+        batches and the frames of the finished window are returned.
+
+        Args:
+            frame_num (int): Index of the frame within the video.
+            frame (numpy.ndarray): The video frame.
+            player_track (dict): Player tracking information for the frame.
+
+        Returns:
+            list: Team assignments of the frames that were completed, in frame order.
+        """
+        if self.assignment_mode == "track":
+            return self.add_frame_by_track(frame_num,frame,player_track)
+        return self.add_frame_by_window(frame_num,frame,player_track)
+
+    def flush(self):
+        """
+        Classifies every pending crop and resolves the queued frames.
+
+        Returns:
+            list: Team assignments of the queued frames, in frame order.
+        """
+        if self.assignment_mode == "track":
+            return self.flush_tracks()
+        return self.flush_window()
+
+    def add_frame_by_window(self,frame_num,frame,player_track):
+        """
+        Queues a frame in "window" mode.
+
+        A crop is kept for every player seen for the first time in the current window.
+
+        Args:
+            frame_num (int): Index of the frame within the video.
+            frame (numpy.ndarray): The video frame.
+            player_track (dict): Player tracking information for the frame.
+
+        Returns:
+            list: Team assignments of the frames that were completed, in frame order.
+        """
+        completed = []
+        window = frame_num // self.window_size
+        if window != self.current_window:
+            completed = self.flush_window()
+            self.player_team_dict = {}
+            self.current_window = window
+
+        for player_id, track in player_track.items():
+            if player_id in self.player_team_dict or player_id in self.pending_crops:
+                continue
+            self.pending_crops[player_id] = (self.get_player_crop(frame,track['bbox']),self.get_color_signature(frame,track['bbox']))
+
+        self.pending_frames.append(list(player_track.keys()))
+        return completed
+
+    def flush_window(self):
+        """
+        Classifies the pending crops of the window and resolves the queued frames.
+
+        Returns:
+            list: Team assignments of the queued frames, in frame order.
+        """
+        if self.pending_crops:
+            player_ids = list(self.pending_crops.keys())
+            crops, signatures = zip(*self.pending_crops.values())
+            player_colors = self.classify_crops(list(crops),list(signatures))
+            for player_id, player_color in zip(player_ids, player_colors):
+                self.player_team_dict[player_id] = self.get_team_id(player_color)
+            self.pending_crops = {}
+
+        completed = [
+            {player_id: self.player_team_dict[player_id] for player_id in player_ids}
+            for player_ids in self.pending_frames
+        ]
+        self.pending_frames = []
+        return completed
+
+    def add_frame_by_track(self,frame_num,frame,player_track):
+        """
+        Queues a frame in "track" mode.
+
+        Good-quality crops are sampled for every track that has not collected its votes
+        yet, and tracks that already have a team are checked for appearance drift every
+        few frames. Queued frames are resolved once per window.
+
+        Args:
+            frame_num (int): Index of the frame within the video.
+            frame (numpy.ndarray): The video frame.
+            player_track (dict): Player tracking information for the frame.
+
+        Returns:
+            list: Team assignments of the frames that were completed, in frame order.
+        """
+        completed = []
+        window = frame_num // self.window_size
+        if window != self.current_window:
+            completed = self.flush_tracks()
+            self.current_window = window
+            self.expire_tracks(frame_num)
+
+        frame_bboxes = {player_id: track['bbox'] for player_id, track in player_track.items()}
+        for player_id, bbox in frame_bboxes.items():
+            state = self.track_states.get(player_id)
+            if state is None:
+                state = self.new_track_state()
+                self.track_states[player_id] = state
+            state['last_seen'] = frame_num
+
+            if state['team'] is not None and frame_num - state['last_check'] >= self.drift_check_interval:
+                state['last_check'] = frame_num
+                signature = self.get_appearance_signature(frame,bbox)
+                if signature is not None and state['signature'] is not None:
+                    distance = cv2.compareHist(state['signature'],signature,cv2.HISTCMP_BHATTACHARYYA)
+                    if distance > self.drift_threshold:
+                        # the appearance changed (likely an ID switch), vote again
+                        team = state['team']
+                        state.update(self.new_track_state())
+                        state['previous_team'] = team
+                        state['last_seen'] = frame_num
+
+            sampled = state['votes'] + len(state['crops'])
+            if sampled < self.votes_per_track and frame_num - state['last_sample'] >= self.sample_interval \
+                    and self.is_good_crop(player_id,bbox,frame_bboxes):
+                state['crops'].append(self.get_player_crop(frame,bbox))
+                state['signatures'].append(self.get_appearance_signature(frame,bbox))
+                state['last_sample'] = frame_num
+                state['last_check'] = frame_num
+            elif state['team'] is None and not state['crops'] and state['fallback'] is None:
+                # keep one crop in case no good one shows up before the window closes
+                state['fallback'] = (self.get_player_crop(frame,bbox),self.get_appearance_signature(frame,bbox))
+
+        self.pending_frames.append(list(player_track.keys()))
+        return completed
+
+    def new_track_state(self):
+        """
+        Creates the voting state of a track.
+
+        Returns:
+            dict: An empty track state.
+        """
+        return {
+            'team': None,
+            'previous_team': None,
+            'probabilities': np.zeros(2),
+            'votes': 0,
+            'crops': [],
+            'signatures': [],
+            'vote_signatures': [],
+            'fallback': None,
+            'signature': None,
+            'last_sample': -self.sample_interval,
+            'last_check': 0,
+            'last_seen': 0,
+        }
+
+    def flush_tracks(self):
+        """
+        Classifies the sampled crops of every track in batches, aggregates the votes
+        and resolves the queued frames.
+
+        Returns:
+            list: Team assignments of the queued frames, in frame order.
+        """
+        crops = []
+        owners = []
+        for player_id, state in self.track_states.items():
+            if state['crops']:
+                crops += state['crops']
+                owners += [(player_id, signature) for signature in state['signatures']]
+            elif state['team'] is None and state['fallback'] is not None:
+                crops.append(state['fallback'][0])
+                owners.append((player_id, state['fallback'][1]))
+
+        if crops:
+            probabilities = self.get_team_probabilities(crops,[signature for _, signature in owners]).tolist()
+            for (player_id, signature), crop_probabilities in zip(owners, probabilities):
+                state = self.track_states[player_id]
+                state['probabilities'] += crop_probabilities
+                state['votes'] += 1
+                if signature is not None:
+                    state['vote_signatures'].append(signature)
+
+            for player_id in {player_id for player_id, _ in owners}:
+                state = self.track_states[player_id]
+                state['team'] = 1 if state['probabilities'][0] >= state['probabilities'][1] else 2
+                state['crops'] = []
+                state['signatures'] = []
+                state['fallback'] = None
+                if state['vote_signatures']:
+                    state['signature'] = np.mean(state['vote_signatures'],axis=0).astype(np.float32)
+
+        completed = []
+        for player_ids in self.pending_frames:
+            frame_assignment = {}
+            for player_id in player_ids:
+                state = self.track_states.get(player_id)
+                team = state['team'] if state is not None else None
+                if team is None and state is not None:
+                    team = state['previous_team']
+                frame_assignment[player_id] = team if team is not None else -1
+            completed.append(frame_assignment)
+        self.pending_frames = []
+        return completed
+
+    def expire_tracks(self,frame_num):
+        """
+        Forgets tracks that have not been seen for many windows, so memory stays bounded
+        on long videos where the tracker keeps creating new IDs.
+
+        Args:
+            frame_num (int): Index of the current frame.
+        """
+        expiry = 10 * self.window_size
+        for player_id in [player_id for player_id, state in self.track_states.items()
+                          if frame_num - state['last_seen'] > expiry and not state['crops']]:
+            del self.track_states[player_id]
+
     def get_player_teams_across_frames(self,video_frames,player_tracks,read_from_stub=False, stub_path=None):
         """
         Processes all video frames to assign teams to players, with optional caching.
 
         Args:
-            video_frames (list): List of video frames to process.
+            video_frames (list or VideoFrameSource): Video frames to process. Frames are
+                consumed in batches, so a VideoFrameSource is never fully loaded.
             player_tracks (list): List of player tracking information for each frame.
             read_from_stub (bool): Whether to attempt reading cached results.
             stub_path (str): Path to the cache file.
@@ -111,27 +683,24 @@ class TeamAssigner:
         Returns:
             list: List of dictionaries mapping player IDs to team assignments for each frame.
         """
-        
+
         player_assignment = read_stub(read_from_stub,stub_path)
         if player_assignment is not None:
-            if len(player_assignment) == len(video_frames):
+            if stub_matches_frames(player_assignment,video_frames):
                 return player_assignment
 
         self.load_model()
+        self.reset()
 
         player_assignment=[]
-        for frame_num, player_track in enumerate(player_tracks):        
-            player_assignment.append({})
-            
-            if frame_num %50 ==0:
-                self.player_team_dict = {}
-
-            for player_id, track in player_track.items():
-                team = self.get_player_team(video_frames[frame_num],   
-                                                    track['bbox'],
-                                                    player_id)
-                player_assignment[frame_num][player_id] = team
-        
+        for batch in iter_frame_batches(video_frames,self.batch_size):
+            for offset, frame in enumerate(batch.frames):
+                frame_num = batch.start_index + offset
+                if frame_num >= len(player_tracks):
+                    break
+                player_assignment += self.add_frame(frame_num,frame,player_tracks[frame_num])
+        player_assignment += self.flush()
+
         save_stub(stub_path,player_assignment)
 
-        return player_assignment
\ No newline at end of file
+        return player_assignment
@@ -1,6 +1,7 @@
-from detectors import TeamAssigner, CourtKeypointDetector, PassAndInterceptionDetector, BallAquisitionDetector, TacticalViewConverter
+from detectors import TeamAssigner, CourtKeypointDetector, PassAndInterceptionDetector, BallAquisitionDetector, TacticalViewConverter, HomographyCache
 from trackers import BallTracker, PlayerTracker, SpeedAndDistanceCalculator
-from utils import read_video
+from utils import VideoFrameSource
+from pipeline import FrameFanOut, PLAYER_TRACKS, PLAYER_ASSIGNMENT, BALL_TRACKS, COURT_KEYPOINTS
 
 import os
 
@@ -9,27 +10,40 @@ BALL_DETECTOR_PATH = "models/ball_detector_model.pt"
 COURT_KEYPOINT_DETECTOR_PATH = "models/court_keypoint_detector.pt"
 
 def main(video_location,stub_path):
-    # upload the video and run the detector
-    video_frames = read_video(video_location)
+    # open the video; frames are decoded lazily batch by batch
+    video_frames = VideoFrameSource(video_location)
 
     # setup the trackers
     player_tracker = PlayerTracker(PLAYER_DETECTOR_PATH)
-    ball_tracker = BallTracker(BALL_DETECTOR_PATH)
-    court_tracker = CourtKeypointDetector(COURT_KEYPOINT_DETECTOR_PATH)
+    ball_tracker = BallTracker(BALL_DETECTOR_PATH,use_motion_model=True)
+    court_tracker = CourtKeypointDetector(COURT_KEYPOINT_DETECTOR_PATH,use_keyframes=True)
 
-    # run the detectors
-    player_tracks = player_tracker.get_object_tracks(video_frames,read_from_stub=True,stub_path=os.path.join(stub_path,'player_Track_stubs.pkl'))
+    # team assigner
+    team_assigner = TeamAssigner(assignment_mode="track",use_color_classifier=True)
+
+    # run the detectors off a single decode of the video
+    fan_out = FrameFanOut(
+        player_tracker=player_tracker,
+        ball_tracker=ball_tracker,
+        court_detector=court_tracker,
+        team_assigner=team_assigner,
+    )
+    stage_results = fan_out.run(video_frames,read_from_stub=True,stub_paths={
+        PLAYER_TRACKS: os.path.join(stub_path,'player_Track_stubs.pkl'),
+        PLAYER_ASSIGNMENT: os.path.join(stub_path,'player_assignment_stubs.pkl'),
+        BALL_TRACKS: os.path.join(stub_path,'ball_track_stubs.pkl'),
+        COURT_KEYPOINTS: os.path.join(stub_path,'court_key_points_stub.pkl'),
+    })
+    player_tracks = stage_results[PLAYER_TRACKS]
+    player_assignment = stage_results[PLAYER_ASSIGNMENT]
+    ball_tracks = stage_results[BALL_TRACKS]
+    court_keypoints_per_frame = stage_results[COURT_KEYPOINTS]
+    print(f"team classification {team_assigner.get_classification_report()}")
+    print(f"court keypoints {court_tracker.get_keyframe_report()}")
 
     # dump
     # print(player_tracks)
 
-    # team assigner
-    team_assigner = TeamAssigner()
-    player_assignment = team_assigner.get_player_teams_across_frames(video_frames,player_tracks,read_from_stub=True,stub_path=os.path.join(stub_path,'player_Track_stubs.pkl'))
-
-    # ball tracks
-    ball_tracks = ball_tracker.get_object_tracks(video_frames,read_from_stub=True,stub_path=os.path.join(stub_path, 'ball_track_stubs.pkl'))                                             
-
     # clean up
     ball_tracks = ball_tracker.remove_wrong_detections(ball_tracks)
     # refine
@@ -46,20 +60,22 @@ def main(video_location,stub_path):
 
     # Tactical View
     tactical_view_converter = TacticalViewConverter(
-        court_image_path="./images/basketball_court.png"
+        court_image_path="./images/basketball_court.png",
+        homography_cache=HomographyCache()
     )
 
     # key  points
-    court_keypoints_per_frame = court_tracker.get_court_keypoints(video_frames,read_from_stub=True,stub_path=os.path.join(stub_path, 'court_key_points_stub.pkl'))
-    court_keypoints_per_frame = tactical_view_converter.validate_keypoints(court_keypoints_per_frame)
-    tactical_player_positions = tactical_view_converter.transform_players_to_tactical_view(court_keypoints_per_frame,player_tracks)
+    court_keypoints_per_frame, court_keypoint_mask = tactical_view_converter.validate_keypoints(court_keypoints_per_frame)
+    tactical_player_positions = tactical_view_converter.transform_players_to_tactical_table(court_keypoints_per_frame,player_tracks,court_keypoint_mask)
+    print(f"Homography cache: {tactical_view_converter.homography_cache.get_stats()}")
 
     # Speed and Distance Calculator
     speed_and_distance_calculator = SpeedAndDistanceCalculator(
         tactical_view_converter.width,
         tactical_view_converter.height,
         tactical_view_converter.actual_width_in_meters,
-        tactical_view_converter.actual_height_in_meters
+        tactical_view_converter.actual_height_in_meters,
+        fps=video_frames.fps
     )
     player_distances_per_frame = speed_and_distance_calculator.calculate_distance(tactical_player_positions)
     player_speed_per_frame = speed_and_distance_calculator.calculate_speed(player_distances_per_frame)
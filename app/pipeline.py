@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import iter_frame_batches, read_stub, save_stub, stub_matches_frames
+
+PLAYER_TRACKS = "player_tracks"
+PLAYER_ASSIGNMENT = "player_assignment"
+BALL_TRACKS = "ball_tracks"
+COURT_KEYPOINTS = "court_keypoints"
+
+
+class FrameFanOut:
+    """
+    Runs every frame-consuming stage off a single pass over the video.
+
+    Each batch of frames is decoded exactly once and handed to the player tracker,
+    ball tracker and court keypoint detector concurrently. Team assignment needs the
+    player tracks of the same batch, so it runs right after player tracking in the
+    same worker. Stages are processed batch by batch in order, which keeps stateful
+    stages such as ByteTrack consistent with whole-video processing.
+
+    Attributes:
+        player_tracker (PlayerTracker): Tracker used for players, or None to skip.
+        ball_tracker (BallTracker): Tracker used for the ball, or None to skip.
+        court_detector (CourtKeypointDetector): Court keypoint detector, or None to skip.
+        team_assigner (TeamAssigner): Team assigner, or None to skip.
+        batch_size (int): Number of frames decoded per batch.
+        max_workers (int): Number of detectors allowed to run at the same time.
+    """
+    def __init__(self,
+                 player_tracker=None,
+                 ball_tracker=None,
+                 court_detector=None,
+                 team_assigner=None,
+                 batch_size=20,
+                 max_workers=3,
+                 ):
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.court_detector = court_detector
+        self.team_assigner = team_assigner
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+
+    def run(self, frames, read_from_stub=False, stub_paths=None):
+        """
+        Run all configured stages over the frames, decoding each batch only once.
+
+        Stages whose results can be read from a stub of the right length are skipped.
+
+        Args:
+            frames (list or VideoFrameSource): Video frames to process.
+            read_from_stub (bool): Whether to attempt reading cached results.
+            stub_paths (dict): Cache file path per stage name (PLAYER_TRACKS,
+                PLAYER_ASSIGNMENT, BALL_TRACKS, COURT_KEYPOINTS).
+
+        Returns:
+            dict: Per-frame results keyed by stage name. Only configured stages are present.
+        """
+        stub_paths = stub_paths or {}
+        stages = {
+            PLAYER_TRACKS: self.player_tracker,
+            PLAYER_ASSIGNMENT: self.team_assigner,
+            BALL_TRACKS: self.ball_tracker,
+            COURT_KEYPOINTS: self.court_detector,
+        }
+
+        results = {}
+        for name, stage in stages.items():
+            if stage is None:
+                continue
+            cached = read_stub(read_from_stub,stub_paths.get(name))
+            if cached is not None and stub_matches_frames(cached,frames):
+                results[name] = cached
+
+        pending = {name: [] for name, stage in stages.items() if stage is not None and name not in results}
+        if PLAYER_ASSIGNMENT in pending and PLAYER_TRACKS not in pending and PLAYER_TRACKS not in results:
+            raise ValueError("Team assignment requires a player tracker or cached player tracks.")
+        if not pending:
+            return results
+
+        if PLAYER_ASSIGNMENT in pending:
+            self.team_assigner.load_model()
+            self.team_assigner.reset()
+        if BALL_TRACKS in pending:
+            self.ball_tracker.reset()
+        if COURT_KEYPOINTS in pending:
+            self.court_detector.reset()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in iter_frame_batches(frames,self.batch_size):
+                futures = {}
+                if PLAYER_TRACKS in pending or PLAYER_ASSIGNMENT in pending:
+                    futures[PLAYER_TRACKS] = executor.submit(self._process_players, batch, pending, results)
+                if BALL_TRACKS in pending:
+                    futures[BALL_TRACKS] = executor.submit(self.ball_tracker.track_frames, batch.frames)
+                if COURT_KEYPOINTS in pending:
+                    futures[COURT_KEYPOINTS] = executor.submit(self.court_detector.detect_keypoints, batch.frames)
+
+                for name, future in futures.items():
+                    if name == PLAYER_TRACKS:
+                        player_tracks, player_assignment = future.result()
+                        if PLAYER_TRACKS in pending:
+                            pending[PLAYER_TRACKS] += player_tracks
+                        if PLAYER_ASSIGNMENT in pending:
+                            pending[PLAYER_ASSIGNMENT] += player_assignment
+                    else:
+                        pending[name] += future.result()
+
+        if PLAYER_ASSIGNMENT in pending:
+            pending[PLAYER_ASSIGNMENT] += self.team_assigner.flush()
+
+        for name, values in pending.items():
+            if stub_paths.get(name) is not None:
+                save_stub(stub_paths[name],values)
+            results[name] = values
+
+        return results
+
+    def _process_players(self, batch, pending, results):
+        """
+        Track players in a batch and assign their teams.
+
+        Args:
+            batch (FrameBatch): The batch of frames to process.
+            pending (dict): Stages still to be computed.
+            results (dict): Stages already available from stubs.
+
+        Returns:
+            tuple: (player_tracks, player_assignment) where player_assignment holds the
+                team assignments completed so far, which may lag behind the batch.
+        """
+        if PLAYER_TRACKS in pending:
+            player_tracks = self.player_tracker.track_frames(batch.frames)
+        else:
+            player_tracks = results[PLAYER_TRACKS][batch.start_index:batch.start_index+len(batch.frames)]
+
+        player_assignment = []
+        if PLAYER_ASSIGNMENT in pending:
+            for offset, (frame, player_track) in enumerate(zip(batch.frames, player_tracks)):
+                player_assignment += self.team_assigner.add_frame(batch.start_index + offset, frame, player_track)
+
+        return player_tracks, player_assignment
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import trackers.ball_tracker as ball_tracker_module
+from trackers import BallTracker
+
+
+class FakeBallModel:
+    """
+    Stands in for the YOLO ball model: the ball is the block of 255 pixels in the image.
+    """
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    def predict(self, images, **kwargs):
+        detections = []
+        for image in images:
+            ys, xs = np.nonzero(image[:, :, 0] == 255)
+            detections.append([float(xs.min()), float(ys.min()), float(xs.max() + 1), float(ys.max() + 1)] if len(xs) else None)
+        return detections
+
+
+def get_ball_candidates(detection, offset=(0, 0)):
+    if detection is None:
+        return []
+    x1, y1, x2, y2 = detection
+    return [([x1 + offset[0], y1 + offset[1], x2 + offset[0], y2 + offset[1]], 0.9)]
+
+
+def make_video(start, velocity, frame_count=30):
+    frames = []
+    for frame_num in range(frame_count):
+        frame = np.zeros((480, 854, 3), dtype=np.uint8)
+        x, y = (np.array(start) + frame_num * np.array(velocity)).astype(int)
+        frame[y:y+10, x:x+10] = 255
+        frames.append(frame)
+    return frames
+
+
+def make_tracker(monkeypatch):
+    monkeypatch.setattr(ball_tracker_module, "YOLO", FakeBallModel)
+    tracker = BallTracker("ball.pt", use_motion_model=True)
+    monkeypatch.setattr(tracker, "get_ball_candidates", get_ball_candidates)
+    return tracker
+
+
+def test_second_video_starts_clean(monkeypatch):
+    first_video = make_video((50, 100), (5, 0))
+    second_video = make_video((700, 400), (-4, -2))
+
+    tracker = make_tracker(monkeypatch)
+    tracker.get_object_tracks(first_video)
+    assert tracker.get_detection_report()["roi"] > 0
+    second_tracks = tracker.get_object_tracks(second_video)
+
+    fresh_tracker = make_tracker(monkeypatch)
+    assert second_tracks == fresh_tracker.get_object_tracks(second_video)
+    assert tracker.get_detection_report() == fresh_tracker.get_detection_report()
+    assert tracker.get_detection_report()["full_frame"] + tracker.get_detection_report()["roi"] == len(second_video)
+    assert all(1 in track for track in second_tracks)
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from trackers import SpeedAndDistanceCalculator
+from utils import PositionTable
+
+
+def reference_distance(calculator, tactical_player_positions):
+    previous_players_position = {}
+    output_distances = []
+    for frame_number, tactical_player_position_frame in enumerate(tactical_player_positions):
+        output_distances.append({})
+        for player_id, current_player_position in tactical_player_position_frame.items():
+            if player_id in previous_players_position:
+                output_distances[frame_number][player_id] = calculator.calculate_meter_distance(previous_players_position[player_id], current_player_position)
+            previous_players_position[player_id] = current_player_position
+    return output_distances
+
+
+def reference_speed(distances, fps):
+    speeds = []
+    window_size = 5
+    for frame_idx in range(len(distances)):
+        speeds.append({})
+        for player_id in distances[frame_idx].keys():
+            start_frame = max(0, frame_idx - (window_size * 3) + 1)
+            total_distance = 0
+            frames_present = 0
+            last_frame_present = None
+            for i in range(start_frame, frame_idx + 1):
+                if player_id in distances[i]:
+                    if last_frame_present is not None:
+                        total_distance += distances[i][player_id]
+                        frames_present += 1
+                    last_frame_present = i
+            if frames_present >= window_size:
+                speeds[frame_idx][player_id] = (total_distance / 1000) / (frames_present / fps / 3600)
+            else:
+                speeds[frame_idx][player_id] = 0
+    return speeds
+
+
+def make_positions(frame_count, seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 300, (25, 2))
+    positions = []
+    for _ in range(frame_count):
+        points += rng.normal(0, 1, points.shape)
+        player_ids = rng.choice(25, rng.integers(0, 12), replace=False)
+        positions.append({int(player_id): np.float32(points[player_id]).tolist() for player_id in player_ids})
+    return positions
+
+
+def assert_frames_equal(actual, expected):
+    assert actual == expected
+    for actual_frame, expected_frame in zip(actual, expected):
+        assert list(actual_frame) == list(expected_frame)
+        assert [type(value) for value in actual_frame.values()] == [type(value) for value in expected_frame.values()]
+
+
+def test_distance_and_speed_match_reference():
+    calculator = SpeedAndDistanceCalculator(300, 161, 28, 15, fps=25)
+    for seed in range(10):
+        positions = make_positions(300, seed)
+        expected_distances = reference_distance(calculator, positions)
+
+        distances = calculator.calculate_distance(positions)
+        assert_frames_equal(distances, expected_distances)
+        assert_frames_equal(calculator.calculate_distance(PositionTable.from_frame_dicts(positions)), expected_distances)
+        assert_frames_equal(calculator.calculate_speed(distances), reference_speed(expected_distances, 25))
+
+
+def test_empty_video():
+    calculator = SpeedAndDistanceCalculator(300, 161, 28, 15)
+    assert calculator.calculate_distance([{}, {}]) == [{}, {}]
+    assert calculator.calculate_speed([{}, {}]) == [{}, {}]
@@ -1,3 +1,4 @@
 from .player_tracker import PlayerTracker
 from .ball_tracker import BallTracker
+from .ball_motion import BallMotionModel
 from .speed_distance import SpeedAndDistanceCalculator
\ No newline at end of file
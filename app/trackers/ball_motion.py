@@ -0,0 +1,180 @@
+import numpy as np
+
+
+class BallMotionModel:
+    """
+    Constant-velocity Kalman filter over the ball center, in pixels per frame.
+
+    The state is (x, y, vx, vy). Process noise follows a white-noise acceleration
+    model, so the filter tolerates the speed changes of passes and bounces while
+    staying tight on a ball in steady flight. Besides smoothing, the filter predicts
+    where the ball will be in the next frame, which is used to gate detections and to
+    decide when the detector can look at a small crop instead of the whole frame.
+
+    Attributes:
+        mean (numpy.ndarray): State estimate (x, y, vx, vy), None until initiated.
+        covariance (numpy.ndarray): State covariance of shape (4, 4).
+        frames_since_update (int): Frames predicted since the last measurement.
+        hits (int): Number of measurements absorbed since initiation.
+        size (numpy.ndarray): Smoothed ball box (width, height) in pixels.
+        last_center (numpy.ndarray): Center (x, y) of the last measurement.
+    """
+    def __init__(self,
+                 acceleration_std=4.0,
+                 measurement_std=3.0,
+                 initial_velocity_std=25.0,
+                 size_smoothing=0.3,
+                 ):
+        """
+        Initialize the filter without a state.
+
+        Args:
+            acceleration_std (float): Standard deviation of the per-frame acceleration, in pixels.
+            measurement_std (float): Standard deviation of a detected ball center, in pixels.
+            initial_velocity_std (float): Velocity uncertainty when a track is initiated,
+                in pixels per frame.
+            size_smoothing (float): Weight of a new detection in the smoothed box size.
+        """
+        self.transition = np.array([[1., 0., 1., 0.],
+                                    [0., 1., 0., 1.],
+                                    [0., 0., 1., 0.],
+                                    [0., 0., 0., 1.]])
+        self.observation = np.array([[1., 0., 0., 0.],
+                                     [0., 1., 0., 0.]])
+        # white-noise acceleration over one frame
+        noise_gain = np.array([[0.5, 0.], [0., 0.5], [1., 0.], [0., 1.]])
+        self.process_noise = noise_gain @ noise_gain.T * acceleration_std ** 2
+        self.measurement_noise = np.eye(2) * measurement_std ** 2
+        self.measurement_std = measurement_std
+        self.initial_velocity_std = initial_velocity_std
+        self.size_smoothing = size_smoothing
+        self.reset()
+
+    def reset(self):
+        """
+        Drop the current state, the next measurement starts a new track.
+        """
+        self.mean = None
+        self.covariance = None
+        self.frames_since_update = 0
+        self.hits = 0
+        self.size = None
+        self.last_center = None
+
+    @property
+    def is_initiated(self):
+        """
+        Returns:
+            bool: Whether the filter holds a state.
+        """
+        return self.mean is not None
+
+    def initiate(self, bbox):
+        """
+        Start a new track from a ball detection, with zero velocity.
+
+        Args:
+            bbox (list): Ball bounding box (x1, y1, x2, y2).
+        """
+        center, size = self.get_center_and_size(bbox)
+        self.mean = np.array([center[0], center[1], 0., 0.])
+        self.covariance = np.diag([self.measurement_std ** 2, self.measurement_std ** 2,
+                                   self.initial_velocity_std ** 2, self.initial_velocity_std ** 2])
+        self.size = size
+        self.last_center = center
+        self.frames_since_update = 0
+        self.hits = 1
+
+    def predict(self):
+        """
+        Advance the state by one frame.
+
+        Returns:
+            numpy.ndarray: Predicted ball center (x, y), or None when not initiated.
+        """
+        if not self.is_initiated:
+            return None
+        self.mean = self.transition @ self.mean
+        self.covariance = self.transition @ self.covariance @ self.transition.T + self.process_noise
+        self.frames_since_update += 1
+        return self.mean[:2].copy()
+
+    def predict_ahead(self, steps):
+        """
+        Predict the ball center over the next frames without changing the state.
+
+        Args:
+            steps (int): Number of frames to predict.
+
+        Returns:
+            numpy.ndarray: Predicted centers of shape (steps, 2), the first one being the
+                center predict() would return next.
+        """
+        centers = np.empty((steps, 2))
+        mean = self.mean
+        for step in range(steps):
+            mean = self.transition @ mean
+            centers[step] = mean[:2]
+        return centers
+
+    def update(self, bbox):
+        """
+        Correct the predicted state with a ball detection.
+
+        Args:
+            bbox (list): Ball bounding box (x1, y1, x2, y2).
+        """
+        if not self.is_initiated:
+            self.initiate(bbox)
+            return
+        center, size = self.get_center_and_size(bbox)
+        innovation_covariance = self.observation @ self.covariance @ self.observation.T + self.measurement_noise
+        gain = self.covariance @ self.observation.T @ np.linalg.inv(innovation_covariance)
+        self.mean = self.mean + gain @ (center - self.observation @ self.mean)
+        self.covariance = (np.eye(4) - gain @ self.observation) @ self.covariance
+        self.size = self.size + self.size_smoothing * (size - self.size)
+        self.last_center = center
+        self.frames_since_update = 0
+        self.hits += 1
+
+    def gating_distances(self, bboxes):
+        """
+        Squared Mahalanobis distance of each detection from the predicted ball center.
+
+        Args:
+            bboxes (numpy.ndarray): Candidate ball boxes of shape (N, 4).
+
+        Returns:
+            numpy.ndarray: Distances of shape (N,). Compare with a chi-square quantile
+                with 2 degrees of freedom, e.g. 9.21 for 99%.
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        if not self.is_initiated:
+            return np.zeros(len(bboxes))
+        centers = np.column_stack(((bboxes[:, 0] + bboxes[:, 2]) / 2, (bboxes[:, 1] + bboxes[:, 3]) / 2))
+        innovation_covariance = self.observation @ self.covariance @ self.observation.T + self.measurement_noise
+        residuals = centers - self.mean[:2]
+        return np.einsum('ni,ij,nj->n', residuals, np.linalg.inv(innovation_covariance), residuals)
+
+    def position_std(self):
+        """
+        Returns:
+            float: Largest standard deviation of the predicted center, in pixels.
+                Infinite when not initiated.
+        """
+        if not self.is_initiated:
+            return float('inf')
+        return float(np.sqrt(np.linalg.eigvalsh(self.covariance[:2, :2]).max()))
+
+    def get_center_and_size(self, bbox):
+        """
+        Split a bounding box into its center and size.
+
+        Args:
+            bbox (list): Bounding box (x1, y1, x2, y2).
+
+        Returns:
+            tuple: (center, size) as float arrays of shape (2,).
+        """
+        x1, y1, x2, y2 = bbox
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2]), np.array([x2 - x1, y2 - y1], dtype=np.float64)
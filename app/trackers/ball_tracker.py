@@ -1,10 +1,11 @@
 from ultralytics import YOLO
 import supervision as sv
+import math
 import numpy as np
-import pandas as pd
 import sys 
 sys.path.append('../')
-from utils import read_stub, save_stub
+from utils import read_stub, save_stub, iter_frame_batches, stub_matches_frames
+from .ball_motion import BallMotionModel
 
 
 class BallTracker:
@@ -13,109 +14,457 @@ class BallTracker:
 
     This class provides methods to detect the ball in video frames, process detections
     in batches, and refine tracking results through filtering and interpolation.
+
+    With the motion model enabled, a Kalman filter follows the ball across frames. A
+    detection is only accepted when it falls inside the filter's gate around the
+    predicted position. In ROI mode, once the ball is locked, the ball model runs on a
+    fixed-size window around the predicted position of each frame instead of the full
+    frame, and goes back to full frames after max_roi_misses windows in a row without
+    the ball. The filter state carries over between calls to track_frames, so batches
+    must be passed in frame order.
+
+    Attributes:
+        use_motion_model (bool): Whether detections are gated by the motion model.
+        motion_model (BallMotionModel): The Kalman filter following the ball.
+        use_roi (bool): Whether windows around the predicted ball are searched once locked.
+        crop_size (int): Side in pixels of the square window searched around the prediction,
+            also used as the inference size of the window, so a multiple of 32.
+        roi_lookahead (int): Frames whose windows are predicted and detected together.
+        min_lock_hits (int): Detections the track needs before windows are searched.
+        max_roi_misses (int): Consecutive windows without the ball before falling back
+            to full frames.
+        gate_threshold (float): Largest squared Mahalanobis distance of an accepted detection.
+        max_jump_distance (float): Detections outside the gate are still accepted within this
+            many pixels per frame of the last accepted one, the same bound as
+            remove_wrong_detections; the track then restarts from that detection.
+        max_crop_position_std (float): Largest prediction uncertainty, in pixels, at which
+            windows are searched instead of the full frame.
+        max_missed_frames (int): Frames without an accepted detection before the track
+            is dropped and the ball is searched from scratch.
+        detection_counts (dict): Frames searched per path, see get_detection_report.
     """
-    def __init__(self, model_path):
+    def __init__(self,
+                 model_path,
+                 use_motion_model=False,
+                 use_roi=True,
+                 crop_size=320,
+                 roi_lookahead=5,
+                 min_lock_hits=2,
+                 max_roi_misses=2,
+                 gate_threshold=9.21,
+                 max_jump_distance=25,
+                 max_crop_position_std=15.0,
+                 max_missed_frames=3,
+                 ):
         self.model = YOLO(model_path) 
+        self.batch_size = 20
+
+        self.use_motion_model = use_motion_model
+        self.motion_model = BallMotionModel()
+        self.use_roi = use_roi
+        self.crop_size = crop_size
+        self.roi_lookahead = roi_lookahead
+        self.min_lock_hits = min_lock_hits
+        self.max_roi_misses = max_roi_misses
+        self.gate_threshold = gate_threshold
+        self.max_jump_distance = max_jump_distance
+        self.max_crop_position_std = max_crop_position_std
+        self.max_missed_frames = max_missed_frames
+        self.reset()
 
     def detect_frames(self, frames):
         """
         Detect the ball in a sequence of frames using batch processing.
 
         Args:
-            frames (list): List of video frames to process.
+            frames (list or VideoFrameSource): Video frames to process.
 
         Returns:
             list: YOLO detection results for each frame.
         """
-        batch_size=20 
         detections = [] 
-        for i in range(0,len(frames),batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size],conf=0.5)
+        for batch in iter_frame_batches(frames,self.batch_size):
+            detections_batch = self.model.predict(batch.frames,conf=0.5)
             detections += detections_batch
         return detections
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+    def track_frames(self, frames):
         """
-        Get ball tracking results for a sequence of frames with optional caching.
+        Detect the ball in a batch of frames, keeping the most confident detection per frame.
 
         Args:
-            frames (list): List of video frames to process.
-            read_from_stub (bool): Whether to attempt reading cached results.
-            stub_path (str): Path to the cache file.
+            frames (list): Video frames to process.
 
         Returns:
             list: List of dictionaries containing ball tracking information for each frame.
         """
-        tracks = read_stub(read_from_stub,stub_path)
-        if tracks is not None:
-            if len(tracks) == len(frames):
-                return tracks
+        if self.use_motion_model:
+            return self.track_frames_with_motion(frames)
 
-        detections = self.detect_frames(frames)
+        detections = self.model.predict(frames,conf=0.5)
 
         tracks=[]
 
-        for frame_num, detection in enumerate(detections):
-            cls_names = detection.names
-            cls_names_inv = {v:k for k,v in cls_names.items()}
-
-            # Covert to supervision Detection format
-            detection_supervision = sv.Detections.from_ultralytics(detection)
-
-            tracks.append({})
+        for detection in detections:
+            frame_tracks = {}
             chosen_bbox =None
             max_confidence = 0
             
-            for frame_detection in detection_supervision:
-                bbox = frame_detection[0].tolist()
-                cls_id = frame_detection[3]
-                confidence = frame_detection[2]
-                
-                if cls_id == cls_names_inv['Ball']:
-                    if max_confidence<confidence:
-                        chosen_bbox = bbox
-                        max_confidence = confidence
+            for bbox, confidence in self.get_ball_candidates(detection):
+                if max_confidence<confidence:
+                    chosen_bbox = bbox
+                    max_confidence = confidence
 
             if chosen_bbox is not None:
-                tracks[frame_num][1] = {"bbox":chosen_bbox}
+                frame_tracks[1] = {"bbox":chosen_bbox}
+
+            tracks.append(frame_tracks)
+
+        return tracks
+
+    def get_ball_candidates(self, detection, offset=(0, 0)):
+        """
+        Extract the ball detections of one YOLO result.
+
+        Args:
+            detection: YOLO detection result of one image.
+            offset (tuple): (x, y) position of the image in the frame, for crops.
+
+        Returns:
+            list: (bbox, confidence) of every ball detection, with bbox in frame coordinates.
+        """
+        cls_names = detection.names
+        cls_names_inv = {v:k for k,v in cls_names.items()}
+
+        # Covert to supervision Detection format
+        detection_supervision = sv.Detections.from_ultralytics(detection)
+
+        candidates = []
+        for frame_detection in detection_supervision:
+            bbox = frame_detection[0].tolist()
+            cls_id = frame_detection[3]
+            confidence = frame_detection[2]
+
+            if cls_id == cls_names_inv['Ball']:
+                candidates.append(([bbox[0]+offset[0], bbox[1]+offset[1], bbox[2]+offset[0], bbox[3]+offset[1]], confidence))
+        return candidates
+
+    def get_crop_window(self, frame, center):
+        """
+        Compute a square window of crop_size pixels around a point, kept inside the frame.
+
+        Args:
+            frame (numpy.ndarray): The video frame.
+            center (numpy.ndarray): (x, y) point to center the window on.
+
+        Returns:
+            tuple: (x1, y1, x2, y2) integer window in frame coordinates.
+        """
+        height, width = frame.shape[:2]
+        crop_width = min(self.crop_size, width)
+        crop_height = min(self.crop_size, height)
+        x1 = int(min(max(center[0] - crop_width / 2, 0), width - crop_width))
+        y1 = int(min(max(center[1] - crop_height / 2, 0), height - crop_height))
+        return x1, y1, x1 + crop_width, y1 + crop_height
+
+    def select_ball(self, candidates):
+        """
+        Pick the ball among candidate detections using the motion model.
+
+        Without a track, the most confident candidate is taken. With a track, the most
+        confident candidate inside the gate wins. When the ball changed direction too
+        sharply for the gate, the most confident candidate within max_jump_distance per
+        frame of the last accepted detection is taken instead.
+
+        Args:
+            candidates (list): (bbox, confidence) of each candidate in frame coordinates.
+
+        Returns:
+            tuple: (bbox, gated) with the chosen bounding box, or None, and whether it was
+                inside the gate.
+        """
+        if not self.motion_model.is_initiated or not candidates:
+            return self.get_most_confident(candidates), False
+
+        bboxes = np.array([bbox for bbox, _ in candidates], dtype=np.float64)
+        distances = self.motion_model.gating_distances(bboxes)
+        gated = [candidate for candidate, distance in zip(candidates, distances) if distance <= self.gate_threshold]
+        if gated:
+            return self.get_most_confident(gated), True
+
+        centers = np.column_stack(((bboxes[:, 0] + bboxes[:, 2]) / 2, (bboxes[:, 1] + bboxes[:, 3]) / 2))
+        jumps = np.linalg.norm(centers - self.motion_model.last_center, axis=1)
+        allowed_jump = self.max_jump_distance * max(self.motion_model.frames_since_update, 1)
+        nearby = [candidate for candidate, jump in zip(candidates, jumps) if jump <= allowed_jump]
+        return self.get_most_confident(nearby), False
+
+    def get_most_confident(self, candidates):
+        """
+        Args:
+            candidates (list): (bbox, confidence) of each candidate.
+
+        Returns:
+            list: The bounding box with the highest confidence, or None.
+        """
+        chosen_bbox = None
+        max_confidence = 0
+        for bbox, confidence in candidates:
+            if max_confidence<confidence:
+                chosen_bbox = bbox
+                max_confidence = confidence
+        return chosen_bbox
+
+    def track_frames_with_motion(self, frames):
+        """
+        Detect the ball in a batch of frames, gated by the motion model.
+
+        The frames are handled in chunks of roi_lookahead frames. While the ball is locked
+        and ROI mode is on, a chunk is searched in windows around the predicted positions,
+        all windows of the chunk in one batched call; otherwise the chunk's full frames
+        are searched in one batched call.
+
+        Args:
+            frames (list): Video frames to process, following the previous batch.
+
+        Returns:
+            list: List of dictionaries containing ball tracking information for each frame.
+        """
+        tracks = []
+        while len(tracks) < len(frames):
+            chunk = frames[len(tracks):len(tracks)+self.roi_lookahead]
+            if self.use_roi and self.is_locked():
+                tracks += self.track_roi_chunk(chunk)
+            else:
+                tracks += self.track_full_frame_chunk(chunk)
+        return tracks
+
+    def is_locked(self):
+        """
+        Returns:
+            bool: Whether the prediction is reliable enough to search windows only.
+        """
+        return (self.motion_model.hits >= self.min_lock_hits
+                and self.motion_model.position_std() <= self.max_crop_position_std
+                and self.roi_misses < self.max_roi_misses)
+
+    def track_roi_chunk(self, frames):
+        """
+        Search consecutive frames in windows around the predicted ball positions.
+
+        Stops early, falling back to full frames for the rest, once max_roi_misses
+        consecutive windows held no acceptable ball.
+
+        Args:
+            frames (list): Consecutive video frames.
+
+        Returns:
+            list: Ball tracks of the frames processed, possibly fewer than given.
+        """
+        windows = [self.get_crop_window(frame, center) for frame, center in zip(frames, self.motion_model.predict_ahead(len(frames)))]
+        crops = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for frame, (x1, y1, x2, y2) in zip(frames, windows)]
+        # the windows are inferred at their own size, a fraction of the full frame's compute
+        detections = self.model.predict(crops, conf=0.5, imgsz=self.crop_size, verbose=False)
+
+        tracks = []
+        for detection, (x1, y1, _, _) in zip(detections, windows):
+            self.motion_model.predict()
+            self.detection_counts['roi'] += 1
+            chosen_bbox, gated = self.select_ball(self.get_ball_candidates(detection, (x1, y1)))
+            tracks.append(self.record_ball(chosen_bbox, gated))
+            if chosen_bbox is None:
+                self.detection_counts['roi_miss'] += 1
+                if self.roi_misses >= self.max_roi_misses:
+                    self.detection_counts['fallback'] += 1
+                    break
+        return tracks
+
+    def track_full_frame_chunk(self, frames):
+        """
+        Search consecutive full frames for the ball in one batched call.
+
+        Args:
+            frames (list): Consecutive video frames.
+
+        Returns:
+            list: Ball tracks of the frames.
+        """
+        detections = self.model.predict(frames, conf=0.5, verbose=False)
+
+        tracks = []
+        for detection in detections:
+            self.motion_model.predict()
+            self.detection_counts['full_frame'] += 1
+            chosen_bbox, gated = self.select_ball(self.get_ball_candidates(detection))
+            tracks.append(self.record_ball(chosen_bbox, gated))
+        return tracks
+
+    def record_ball(self, chosen_bbox, gated):
+        """
+        Feed the chosen detection of a frame to the motion model.
+
+        Args:
+            chosen_bbox (list): The accepted ball box, or None.
+            gated (bool): Whether the box was inside the gate.
+
+        Returns:
+            dict: The frame's ball track.
+        """
+        if chosen_bbox is None:
+            self.roi_misses += 1
+            if self.motion_model.frames_since_update > self.max_missed_frames:
+                # the ball is lost, search the whole frame from scratch
+                self.motion_model.reset()
+            return {}
+
+        self.roi_misses = 0
+        if gated:
+            self.motion_model.update(chosen_bbox)
+        else:
+            # no track yet, or the ball changed direction: restart from this detection
+            self.motion_model.initiate(chosen_bbox)
+        return {1: {"bbox":chosen_bbox}}
+
+    def get_detection_report(self):
+        """
+        Summarize how the ball was searched.
+
+        Returns:
+            dict: Frames searched in windows ('roi') and in full ('full_frame'), windows
+                without the ball ('roi_miss'), fallbacks to full frames ('fallback') and
+                the fraction of frames searched in windows ('roi_fraction').
+        """
+        report = dict(self.detection_counts)
+        total = report['roi'] + report['full_frame']
+        report['roi_fraction'] = report['roi'] / total if total else 0.0
+        return report
+
+    def reset(self):
+        """
+        Forget the motion model state, the ROI miss streak and the counters behind
+        get_detection_report. Called by get_object_tracks and FrameFanOut.run at the start
+        of every video, so the report covers the current video only.
+        """
+        self.motion_model.reset()
+        self.roi_misses = 0
+        self.detection_counts = {'roi': 0, 'full_frame': 0, 'roi_miss': 0, 'fallback': 0}
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+        """
+        Get ball tracking results for a sequence of frames with optional caching.
+
+        Args:
+            frames (list or VideoFrameSource): Video frames to process. Frames are
+                consumed in batches, so a VideoFrameSource is never fully loaded.
+            read_from_stub (bool): Whether to attempt reading cached results.
+            stub_path (str): Path to the cache file.
+
+        Returns:
+            list: List of dictionaries containing ball tracking information for each frame.
+        """
+        # every video starts without a ball track
+        self.reset()
+        tracks = read_stub(read_from_stub,stub_path)
+        if tracks is not None:
+            if stub_matches_frames(tracks,frames):
+                return tracks
+
+        tracks=[]
+        for batch in iter_frame_batches(frames,self.batch_size):
+            tracks += self.track_frames(batch.frames)
 
         save_stub(stub_path,tracks)
         
         return tracks
 
-    def remove_wrong_detections(self,ball_positions):
+    def get_ball_position_array(self,ball_positions):
         """
-        Filter out incorrect ball detections based on maximum allowed movement distance.
+        Convert per-frame ball tracks to a position array and a validity mask.
 
         Args:
             ball_positions (list): List of detected ball positions across frames.
 
         Returns:
-            list: Filtered ball positions with incorrect detections removed.
+            tuple: (positions, valid) where positions is a float64 array of shape (N, 4)
+                holding NaN for frames without a ball, and valid is a boolean array of shape (N,).
         """
-        
-        maximum_allowed_distance = 25
-        last_good_frame_index = -1
+        positions = np.full((len(ball_positions),4),np.nan)
+        valid = np.zeros(len(ball_positions),dtype=bool)
+        for i, ball_position in enumerate(ball_positions):
+            bbox = ball_position.get(1,{}).get('bbox',[])
+            if len(bbox) != 0:
+                positions[i] = bbox
+                valid[i] = True
+        return positions, valid
 
-        for i in range(len(ball_positions)):
-            current_box = ball_positions[i].get(1, {}).get('bbox', [])
+    def filter_wrong_detections(self,positions,valid,maximum_allowed_distance=25):
+        """
+        Mark detections that jump further than the ball can move as invalid.
 
-            if len(current_box) == 0:
-                continue
+        A detection is kept when its top-left corner is within maximum_allowed_distance
+        pixels per elapsed frame of the last kept detection. Only the valid frames are
+        visited, with plain float arithmetic, so the pass is O(N) without allocating per frame.
 
-            if last_good_frame_index == -1:
-                # First valid detection
-                last_good_frame_index = i
-                continue
+        Args:
+            positions (numpy.ndarray): Ball boxes of shape (N, 4).
+            valid (numpy.ndarray): Boolean mask of frames with a detection.
+            maximum_allowed_distance (float): Allowed movement in pixels per frame.
 
-            last_good_box = ball_positions[last_good_frame_index].get(1, {}).get('bbox', [])
-            frame_gap = i - last_good_frame_index
-            adjusted_max_distance = maximum_allowed_distance * frame_gap
+        Returns:
+            numpy.ndarray: The validity mask with the rejected detections cleared.
+        """
+        valid = valid.copy()
+        frames = np.flatnonzero(valid)
+        if len(frames) == 0:
+            return valid
+        xs = positions[frames,0].tolist()
+        ys = positions[frames,1].tolist()
+        frames = frames.tolist()
 
-            if np.linalg.norm(np.array(last_good_box[:2]) - np.array(current_box[:2])) > adjusted_max_distance:
-                ball_positions[i] = {}
+        last_good = 0
+        for i in range(1,len(frames)):
+            adjusted_max_distance = maximum_allowed_distance * (frames[i] - frames[last_good])
+            dx = xs[last_good] - xs[i]
+            dy = ys[last_good] - ys[i]
+            if math.sqrt(dx*dx + dy*dy) > adjusted_max_distance:
+                valid[frames[i]] = False
             else:
-                last_good_frame_index = i
+                last_good = i
+        return valid
+
+    def interpolate_positions(self,positions,valid):
+        """
+        Fill the invalid frames by linear interpolation between the valid ones.
+
+        Frames before the first or after the last valid frame take its position. With no
+        valid frame at all, every position is NaN.
+
+        Args:
+            positions (numpy.ndarray): Ball boxes of shape (N, 4).
+            valid (numpy.ndarray): Boolean mask of frames with a usable detection.
+
+        Returns:
+            numpy.ndarray: Float64 array of shape (N, 4) without gaps.
+        """
+        frames = np.flatnonzero(valid)
+        if len(frames) == 0:
+            return np.full((len(positions),4),np.nan)
+        all_frames = np.arange(len(positions))
+        return np.column_stack([np.interp(all_frames,frames,positions[frames,column]) for column in range(4)])
+
+    def remove_wrong_detections(self,ball_positions):
+        """
+        Filter out incorrect ball detections based on maximum allowed movement distance.
+
+        Args:
+            ball_positions (list): List of detected ball positions across frames.
+
+        Returns:
+            list: Filtered ball positions with incorrect detections removed.
+        """
+        positions, valid = self.get_ball_position_array(ball_positions)
+        kept = self.filter_wrong_detections(positions,valid)
+        for i in np.flatnonzero(valid & ~kept).tolist():
+            ball_positions[i] = {}
 
         return ball_positions
 
@@ -129,12 +478,8 @@ class BallTracker:
         Returns:
             list: List of ball positions with interpolated values filling the gaps.
         """
-        ball_positions = [x.get(1,{}).get('bbox',[]) for x in ball_positions]
-        df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
-
-        # Interpolate missing values
-        df_ball_positions = df_ball_positions.interpolate()
-        df_ball_positions = df_ball_positions.bfill()
+        positions, valid = self.get_ball_position_array(ball_positions)
+        positions = self.interpolate_positions(positions,valid)
 
-        ball_positions = [{1: {"bbox":x}} for x in df_ball_positions.to_numpy().tolist()]
+        ball_positions = [{1: {"bbox":x}} for x in positions.tolist()]
         return ball_positions
\ No newline at end of file
@@ -2,7 +2,7 @@ from ultralytics import YOLO
 import supervision as sv
 import sys 
 sys.path.append('../')
-from utils import read_stub, save_stub
+from utils import read_stub, save_stub, iter_frame_batches, stub_matches_frames
 
 class PlayerTracker:
     """
@@ -20,47 +20,43 @@ class PlayerTracker:
         """
         self.model = YOLO(model_path) 
         self.tracker = sv.ByteTrack()
+        self.batch_size = 20
 
     def detect_frames(self, frames):
         """
         Detect players in a sequence of frames using batch processing.
 
         Args:
-            frames (list): List of video frames to process.
+            frames (list or VideoFrameSource): Video frames to process.
 
         Returns:
             list: YOLO detection results for each frame.
         """
-        batch_size=20 
         detections = [] 
-        for i in range(0,len(frames),batch_size):
-            detections_batch = self.model.predict(frames[i:i+batch_size],conf=0.5)
+        for batch in iter_frame_batches(frames,self.batch_size):
+            detections_batch = self.model.predict(batch.frames,conf=0.5)
             detections += detections_batch
         return detections
 
-    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+    def track_frames(self, frames):
         """
-        Get player tracking results for a sequence of frames with optional caching.
+        Detect and track players in a batch of consecutive frames.
+
+        The ByteTrack state is kept on the instance, so calling this repeatedly with
+        consecutive batches yields the same track IDs as tracking the whole video at once.
 
         Args:
-            frames (list): List of video frames to process.
-            read_from_stub (bool): Whether to attempt reading cached results.
-            stub_path (str): Path to the cache file.
+            frames (list): Consecutive video frames to process.
 
         Returns:
-            list: List of dictionaries containing player tracking information for each frame,
-                where each dictionary maps player IDs to their bounding box coordinates.
+            list: List of dictionaries, one per frame, mapping player IDs to their
+                bounding box coordinates.
         """
-        tracks = read_stub(read_from_stub,stub_path)
-        if tracks is not None:
-            if len(tracks) == len(frames):
-                return tracks
-
-        detections = self.detect_frames(frames)
+        detections = self.model.predict(frames,conf=0.5)
 
         tracks=[]
 
-        for frame_num, detection in enumerate(detections):
+        for detection in detections:
             cls_names = detection.names
             cls_names_inv = {v:k for k,v in cls_names.items()}
 
@@ -70,7 +66,7 @@ class PlayerTracker:
             # Track Objects
             detection_with_tracks = self.tracker.update_with_detections(detection_supervision)
 
-            tracks.append({})
+            frame_tracks = {}
 
             for frame_detection in detection_with_tracks:
                 bbox = frame_detection[0].tolist()
@@ -78,7 +74,34 @@ class PlayerTracker:
                 track_id = frame_detection[4]
 
                 if cls_id == cls_names_inv['Player']:
-                    tracks[frame_num][track_id] = {"bbox":bbox}
+                    frame_tracks[track_id] = {"bbox":bbox}
+
+            tracks.append(frame_tracks)
+
+        return tracks
+
+    def get_object_tracks(self, frames, read_from_stub=False, stub_path=None):
+        """
+        Get player tracking results for a sequence of frames with optional caching.
+
+        Args:
+            frames (list or VideoFrameSource): Video frames to process. Frames are
+                consumed in batches, so a VideoFrameSource is never fully loaded.
+            read_from_stub (bool): Whether to attempt reading cached results.
+            stub_path (str): Path to the cache file.
+
+        Returns:
+            list: List of dictionaries containing player tracking information for each frame,
+                where each dictionary maps player IDs to their bounding box coordinates.
+        """
+        tracks = read_stub(read_from_stub,stub_path)
+        if tracks is not None:
+            if stub_matches_frames(tracks,frames):
+                return tracks
+
+        tracks=[]
+        for batch in iter_frame_batches(frames,self.batch_size):
+            tracks += self.track_frames(batch.frames)
         
         save_stub(stub_path,tracks)
         return tracks
\ No newline at end of file
@@ -1,9 +1,10 @@
 import os
 import sys
 import pathlib
+import numpy as np
 folder_path = pathlib.Path(__file__).parent.resolve()
 sys.path.append(os.path.join(folder_path,"../"))
-from utils import measure_distance
+from utils import measure_distance, PositionTable
 
 
 class SpeedAndDistanceCalculator():
@@ -12,6 +13,7 @@ class SpeedAndDistanceCalculator():
                  height_in_pixels,
                  width_in_meters,
                  height_in_meters,
+                 fps=30,
                  ):
         
         self.width_in_pixels = width_in_pixels
@@ -20,25 +22,57 @@ class SpeedAndDistanceCalculator():
         self.width_in_meters = width_in_meters
         self.height_in_meters= height_in_meters
 
+        # frame rate of the video, e.g. VideoFrameSource.fps
+        self.fps = fps
+        self.speed_window_size = 5
+
     def calculate_distance(self,
                             tactical_player_positions
                             ):
-        previous_players_position = {}
-        output_distances =[]
+        """
+        Calculate the distance in meters each player covered since their previous appearance.
 
-        for frame_number, tactical_player_position_frame in enumerate(tactical_player_positions):
-            output_distances.append({})
+        Args:
+            tactical_player_positions (list or PositionTable): Tactical view positions of
+                each frame, as `{player_id: [x, y]}` dictionaries or a PositionTable.
 
-            for player_id, current_player_position in tactical_player_position_frame.items():
-                # Calculate distance
-                if player_id in previous_players_position:
-                    previous_position = previous_players_position[player_id]
-                    meter_distance = self.calculate_meter_distance(previous_position, current_player_position)
-                    output_distances[frame_number][player_id] = meter_distance
+        Returns:
+            list: List of dictionaries mapping player_id to the distance covered since the
+                player was last seen. Players seen for the first time are left out.
+        """
+        if not isinstance(tactical_player_positions, PositionTable):
+            tactical_player_positions = PositionTable.from_frame_dicts(tactical_player_positions)
+        distances = self.calculate_track_distances(tactical_player_positions)
+        return self.to_frame_dicts(tactical_player_positions, distances)
 
-                previous_players_position[player_id]=current_player_position
-        
-        return output_distances
+    def calculate_track_distances(self, positions):
+        """
+        Calculate the distance covered by every row of a position table, one track at a time.
+
+        Args:
+            positions (PositionTable): Tactical view positions.
+
+        Returns:
+            numpy.ndarray: Distance in meters since the previous row of the same track, in
+                the table's row order. NaN for the first row of each track.
+        """
+        order = np.lexsort((positions.frame_index, positions.track_id))
+        track_ids = positions.track_id[order]
+        points = positions.position[order].astype(np.float64)
+
+        # pixel to meter conversion, in the same operation order as calculate_meter_distance
+        meter_x = points[:, 0] * self.width_in_meters / self.width_in_pixels
+        meter_y = points[:, 1] * self.height_in_meters / self.height_in_pixels
+        track_distances = np.full(len(order), np.nan)
+        delta_x = (meter_x[1:] - meter_x[:-1]).tolist()
+        delta_y = (meter_y[1:] - meter_y[:-1]).tolist()
+        # Python's ** as in measure_distance, whose last bit can differ from numpy's square and sqrt
+        track_distances[1:] = [(dx ** 2 + dy ** 2) ** 0.5 * 0.4 for dx, dy in zip(delta_x, delta_y)]
+        track_distances[1:][track_ids[1:] != track_ids[:-1]] = np.nan
+
+        distances = np.empty(len(order))
+        distances[order] = track_distances
+        return distances
 
     def calculate_meter_distance(self,previous_pixel_position, current_pixel_position):
          # using width_in_pixels,height_in_pixels and width_in_meters,height_in_meters Calculate the meter distance betweent current position and previous position
@@ -58,55 +92,95 @@ class SpeedAndDistanceCalculator():
          meter_distance = meter_distance*0.4
          return meter_distance
 
-    def calculate_speed(self, distances, fps=30):
+    def calculate_speed(self, distances, fps=None):
         """
-        Calculate player speeds based on distances covered over the last 5 frames.
+        Calculate player speeds based on the distances covered over the last 15 frames.
+
+        A speed is reported once the player has at least 5 distances in the window, the
+        first distance of the window excluded; before that it is 0. Each player's
+        distances are handled as one time series: the window start is found with a
+        binary search over the player's frames, and the window sums are accumulated in
+        frame order over at most 14 shifted copies of the series, so the work is linear
+        in the number of detections and the sums are exactly those of a frame-by-frame loop.
         
         Args:
             distances (list): List of dictionaries containing distance per player per frame,
                             as output by calculate_distance method.
             fps (float): Frames per second of the video, used to calculate elapsed time.
+                Defaults to the calculator's fps.
             
         Returns:
             list: List of dictionaries where each dictionary maps player_id to their
                 speed in km/h at that frame.
         """
+        if fps is None:
+            fps = self.fps
+        window_frames = self.speed_window_size * 3
+
+        frame_index = []
+        player_ids = []
+        values = []
+        for frame_number, frame_distances in enumerate(distances):
+            for player_id, distance in frame_distances.items():
+                frame_index.append(frame_number)
+                player_ids.append(player_id)
+                values.append(distance)
+        frame_index = np.asarray(frame_index, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+
+        # one time series per player, in frame order
+        _, player_rank = np.unique(np.asarray(player_ids, dtype=np.int64), return_inverse=True)
+        order = np.lexsort((frame_index, player_rank))
+        frames = frame_index[order]
+        track_values = values[order]
+        keys = player_rank[order] * (len(distances) + window_frames) + frames
+        # first entry of each window, the window covering the last 15 frames
+        window_start = np.searchsorted(keys, keys - frames + np.maximum(0, frames - window_frames + 1))
+        positions = np.arange(len(order))
+        frames_present = positions - window_start
+
+        # entries window_start+1..position are added in frame order, starting from 0
+        total_distance = np.zeros(len(order))
+        for offset in range(window_frames - 2, -1, -1):
+            rows = positions - offset
+            included = rows > window_start
+            total_distance += np.where(included, track_values[np.maximum(rows, 0)], 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Calculate time in hours (convert frames to hours)
+            time_in_hours = frames_present / fps / 3600
+            track_speeds = (total_distance / 1000) / time_in_hours
+        has_speed = np.empty(len(order), dtype=bool)
+        has_speed[order] = frames_present >= self.speed_window_size
+        speed_values = np.empty(len(order))
+        speed_values[order] = track_speeds
+
         speeds = []
-        window_size = 5  # Look at last 5 frames for speed calculation
-        
-        # Calculate speed for each frame and player
-        for frame_idx in range(len(distances)):
+        row = 0
+        speed_values = speed_values.tolist()
+        for frame_distances in distances:
             speeds.append({})
-            # For each player in current frame
-            for player_id in distances[frame_idx].keys():
-                # Look back window_size frames or fewer if at the beginning
-                start_frame = max(0, frame_idx - (window_size * 3) + 1)
-                
-                total_distance = 0
-                frames_present = 0
-                last_frame_present = None
-                
-                # Calculate total distance in the window
-                for i in range(start_frame, frame_idx + 1):
-                    if player_id in distances[i]:
-                        if last_frame_present is not None:
-                            total_distance += distances[i][player_id]
-                            frames_present += 1
-                        last_frame_present = i
-                
-                # Calculate speed only if player was present in at least two frames
-                if frames_present >= window_size:
-                    # Calculate time in hours (convert frames to hours)
-                    time_in_seconds = frames_present / fps
-                    time_in_hours = time_in_seconds / 3600
-                    
-                    # Calculate speed in km/h
-                    if time_in_hours > 0:
-                        speed_kmh = (total_distance / 1000) / time_in_hours
-                        speeds[frame_idx][player_id] = speed_kmh
-                    else:
-                        speeds[frame_idx][player_id] = 0
-                else:
-                    speeds[frame_idx][player_id] = 0
-        
-        return speeds
\ No newline at end of file
+            for player_id in frame_distances:
+                speeds[-1][player_id] = speed_values[row] if has_speed[row] else 0
+                row += 1
+        return speeds
+
+    def to_frame_dicts(self, positions, values):
+        """
+        Spread per-row values of a position table over per-frame dictionaries.
+
+        Args:
+            positions (PositionTable): The table the values belong to.
+            values (numpy.ndarray): One value per row, NaN for rows to leave out.
+
+        Returns:
+            list: One `{player_id: value}` dictionary per frame, in the table's row order.
+        """
+        track_ids = positions.track_id.tolist()
+        value_list = values.tolist()
+        keep = (~np.isnan(values)).tolist()
+        output = []
+        for frame_num in range(positions.frame_count):
+            rows = range(positions.frame_offsets[frame_num], positions.frame_offsets[frame_num + 1])
+            output.append({track_ids[row]: value_list[row] for row in rows if keep[row]})
+        return output
@@ -1,3 +1,4 @@
-from .video_utils import read_video, save_video
+from .video_utils import read_video, save_video, VideoFrameSource, FrameBatch, iter_frame_batches
 from .bbox_utils import get_center_of_bbox, get_bbox_width, measure_distance,measure_xy_distance,get_foot_position
-from .stubs_utils import save_stub,read_stub
\ No newline at end of file
+from .stubs_utils import save_stub,read_stub,stub_matches_frames
+from .track_table import TrackTable, PositionTable
\ No newline at end of file
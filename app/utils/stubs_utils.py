@@ -1,5 +1,6 @@
 import os 
 import pickle
+from .video_utils import VideoFrameSource
 
 def save_stub(stub_path,object):
     """
@@ -11,12 +12,14 @@ def save_stub(stub_path,object):
         stub_path (str): File path where the object should be saved.
         object: Any Python object that can be pickled.
     """
-    if not os.path.exists(os.path.dirname(stub_path)):
+    if stub_path is None:
+        return
+
+    if os.path.dirname(stub_path) and not os.path.exists(os.path.dirname(stub_path)):
         os.makedirs(os.path.dirname(stub_path))
 
-    if stub_path is not None:
-        with open(stub_path,'wb') as f:
-            pickle.dump(object,f)
+    with open(stub_path,'wb') as f:
+        pickle.dump(object,f)
 
 def read_stub(read_from_stub,stub_path):
     """
@@ -33,4 +36,25 @@ def read_stub(read_from_stub,stub_path):
         with open(stub_path,'rb') as f:
             object = pickle.load(f)
             return object
-    return None
\ No newline at end of file
+    return None
+
+def stub_matches_frames(stub,frames):
+    """
+    Check that a stub holds one entry per frame of the video.
+
+    The length of a VideoFrameSource is the container's estimate until the video has
+    been walked once, so when it disagrees with the stub the exact count is taken
+    before rejecting the stub.
+
+    Args:
+        stub (list): The per-frame results read from a stub.
+        frames (list or VideoFrameSource): The frames the results should cover.
+
+    Returns:
+        bool: Whether the stub has exactly one entry per frame.
+    """
+    if len(stub) == len(frames):
+        return True
+    if isinstance(frames,VideoFrameSource) and not frames.frame_count_exact:
+        return len(stub) == frames.count_frames()
+    return False
\ No newline at end of file
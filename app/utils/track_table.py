@@ -0,0 +1,316 @@
+import numpy as np
+
+
+class FrameTable:
+    """
+    Rows of per-frame, per-track values sorted by frame.
+
+    Holds the frame and track columns shared by TrackTable and PositionTable along with
+    the per-frame offsets and per-track index built from them. Subclasses call
+    _set_rows from their constructor and sort their own columns with the returned order.
+
+    Attributes:
+        frame_index (numpy.ndarray): Frame of each row, int32 of shape (N,).
+        track_id (numpy.ndarray): Track ID of each row, int32 of shape (N,).
+        frame_count (int): Number of frames covered, including frames without rows.
+        frame_offsets (numpy.ndarray): Rows of frame f are frame_offsets[f]:frame_offsets[f+1].
+    """
+    def _set_rows(self, frame_index, track_id, frame_count=None):
+        """
+        Sort the rows by frame, keeping the given order within a frame.
+
+        Args:
+            frame_index (array-like): Frame of each row.
+            track_id (array-like): Track ID of each row.
+            frame_count (int): Number of frames covered. Defaults to one past the
+                last frame with a row.
+
+        Returns:
+            numpy.ndarray: The order applied, for sorting the other columns.
+        """
+        frame_index = np.asarray(frame_index, dtype=np.int32).reshape(-1)
+        order = np.argsort(frame_index, kind='stable')
+
+        self.frame_index = frame_index[order]
+        self.track_id = np.asarray(track_id, dtype=np.int32).reshape(-1)[order]
+
+        if frame_count is None:
+            frame_count = int(self.frame_index[-1]) + 1 if len(self.frame_index) else 0
+        self.frame_count = frame_count
+        self.frame_offsets = np.searchsorted(self.frame_index, np.arange(frame_count + 1)).astype(np.int64)
+        self._track_rows = None
+        return order
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of rows in the table.
+        """
+        return len(self.frame_index)
+
+    def frame_rows(self, frame_num):
+        """
+        Get the rows of one frame.
+
+        Args:
+            frame_num (int): The frame index.
+
+        Returns:
+            slice: Slice selecting the frame's rows in every column.
+        """
+        return slice(int(self.frame_offsets[frame_num]), int(self.frame_offsets[frame_num + 1]))
+
+    def detections_per_frame(self):
+        """
+        Returns:
+            numpy.ndarray: Number of rows in each frame, shape (frame_count,).
+        """
+        return np.diff(self.frame_offsets)
+
+    @property
+    def track_rows(self):
+        """
+        Per-track index, built on first use.
+
+        Returns:
+            dict: Mapping of track ID to the rows of that track, in frame order.
+        """
+        if self._track_rows is None:
+            order = np.argsort(self.track_id, kind='stable')
+            track_ids, starts = np.unique(self.track_id[order], return_index=True)
+            self._track_rows = dict(zip(track_ids.tolist(), np.split(order, starts[1:]) if len(order) else []))
+        return self._track_rows
+
+
+class TrackTable(FrameTable):
+    """
+    Columnar store of the detections of every frame of a video.
+
+    Each detection is one row across a set of contiguous numpy arrays, sorted by frame
+    and, within a frame, kept in the order the tracker reported them. A detection takes
+    about 30 bytes here against several hundred for the per-frame dictionaries, and
+    whole-video operations such as centers or distances become single array expressions.
+
+    Attributes:
+        frame_index (numpy.ndarray): Frame of each detection, int32 of shape (N,).
+        track_id (numpy.ndarray): Track ID of each detection, int32 of shape (N,).
+        bbox (numpy.ndarray): Bounding boxes (x1, y1, x2, y2), float32 of shape (N, 4).
+        confidence (numpy.ndarray): Detection confidence, float32 of shape (N,). NaN
+            when the source did not record one.
+        class_id (numpy.ndarray): Detection class, int16 of shape (N,).
+        frame_count (int): Number of frames covered, including frames without detections.
+        frame_offsets (numpy.ndarray): Rows of frame f are frame_offsets[f]:frame_offsets[f+1].
+    """
+    def __init__(self, frame_index, track_id, bbox, confidence=None, class_id=None, frame_count=None, bbox_dtype=np.float32):
+        """
+        Initialize the table from column arrays.
+
+        Args:
+            frame_index (array-like): Frame of each detection.
+            track_id (array-like): Track ID of each detection.
+            bbox (array-like): Bounding box of each detection, shape (N, 4).
+            confidence (array-like): Optional confidence of each detection.
+            class_id (array-like): Optional class of each detection, 0 when missing.
+            frame_count (int): Number of frames covered. Defaults to one past the
+                last frame with a detection.
+            bbox_dtype (numpy.dtype): Storage type of the bounding boxes.
+        """
+        order = self._set_rows(frame_index, track_id, frame_count)
+
+        self.bbox = np.asarray(bbox, dtype=bbox_dtype).reshape(-1, 4)[order]
+        if confidence is None:
+            self.confidence = np.full(len(self.frame_index), np.nan, dtype=np.float32)
+        else:
+            self.confidence = np.asarray(confidence, dtype=np.float32).reshape(-1)[order]
+        if class_id is None:
+            self.class_id = np.zeros(len(self.frame_index), dtype=np.int16)
+        else:
+            self.class_id = np.asarray(class_id, dtype=np.int16).reshape(-1)[order]
+
+    @classmethod
+    def from_frame_dicts(cls, tracks, class_id=0, bbox_dtype=np.float32):
+        """
+        Build a table from the per-frame track dictionaries used by the trackers.
+
+        Both `{track_id: {"bbox": [x1, y1, x2, y2]}}` and bare `{track_id: [x1, y1, x2, y2]}`
+        frames are accepted. Entries without a bounding box are skipped. Optional
+        "confidence" and "class_id" keys are carried over.
+
+        Args:
+            tracks (list): One dictionary of tracks per frame.
+            class_id (int): Class recorded for entries without a "class_id" key.
+            bbox_dtype (numpy.dtype): Storage type of the bounding boxes.
+
+        Returns:
+            TrackTable: The table covering len(tracks) frames.
+        """
+        frame_index = []
+        track_ids = []
+        bboxes = []
+        confidences = []
+        class_ids = []
+        for frame_num, frame_tracks in enumerate(tracks):
+            for track_id, track in frame_tracks.items():
+                if isinstance(track, dict):
+                    bbox = track.get('bbox')
+                    confidences.append(track.get('confidence', np.nan))
+                    class_ids.append(track.get('class_id', class_id))
+                else:
+                    bbox = track
+                    confidences.append(np.nan)
+                    class_ids.append(class_id)
+                if bbox is None or len(bbox) != 4:
+                    confidences.pop()
+                    class_ids.pop()
+                    continue
+                frame_index.append(frame_num)
+                track_ids.append(track_id)
+                bboxes.append(bbox)
+
+        return cls(frame_index,
+                   track_ids,
+                   np.asarray(bboxes, dtype=bbox_dtype).reshape(-1, 4),
+                   confidence=confidences,
+                   class_id=class_ids,
+                   frame_count=len(tracks),
+                   bbox_dtype=bbox_dtype)
+
+    def to_frame_dicts(self, bare=False):
+        """
+        Convert the table back to per-frame track dictionaries.
+
+        Args:
+            bare (bool): Whether to emit bare bounding box lists instead of {"bbox": ...}.
+
+        Returns:
+            list: One dictionary of tracks per frame, in the table's frame and row order.
+        """
+        track_ids = self.track_id.tolist()
+        bboxes = self.bbox.tolist()
+        tracks = []
+        for frame_num in range(self.frame_count):
+            start, end = self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+            if bare:
+                tracks.append({track_ids[row]: bboxes[row] for row in range(start, end)})
+            else:
+                tracks.append({track_ids[row]: {"bbox": bboxes[row]} for row in range(start, end)})
+        return tracks
+
+    @property
+    def nbytes(self):
+        """
+        Returns:
+            int: Memory used by the columns, in bytes.
+        """
+        return sum(column.nbytes for column in (self.frame_index, self.track_id, self.bbox, self.confidence, self.class_id, self.frame_offsets))
+
+    def get_track(self, track_id):
+        """
+        Get the frames and bounding boxes of one track.
+
+        Args:
+            track_id (int): The track ID.
+
+        Returns:
+            tuple: (frame_index, bbox) arrays of the track, in frame order. Empty if the
+                track is unknown.
+        """
+        rows = self.track_rows.get(track_id, np.empty(0, dtype=np.int64))
+        return self.frame_index[rows], self.bbox[rows]
+
+    def select(self, rows):
+        """
+        Build a table from a subset of rows, keeping the frame count.
+
+        Args:
+            rows (numpy.ndarray): Boolean mask or row indices.
+
+        Returns:
+            TrackTable: The selected detections.
+        """
+        return TrackTable(self.frame_index[rows],
+                          self.track_id[rows],
+                          self.bbox[rows],
+                          confidence=self.confidence[rows],
+                          class_id=self.class_id[rows],
+                          frame_count=self.frame_count,
+                          bbox_dtype=self.bbox.dtype)
+
+    def centers(self):
+        """
+        Returns:
+            numpy.ndarray: Bounding box centers (x, y), shape (N, 2).
+        """
+        return np.column_stack(((self.bbox[:, 0] + self.bbox[:, 2]) / 2, (self.bbox[:, 1] + self.bbox[:, 3]) / 2))
+
+    def foot_positions(self):
+        """
+        Returns:
+            numpy.ndarray: Bottom center points (x, y) of the bounding boxes, shape (N, 2).
+        """
+        return np.column_stack(((self.bbox[:, 0] + self.bbox[:, 2]) / 2, self.bbox[:, 3]))
+
+
+class PositionTable(FrameTable):
+    """
+    Columnar store of one (x, y) position per track and frame, e.g. tactical view positions.
+
+    Attributes:
+        position (numpy.ndarray): Positions (x, y), float32 of shape (N, 2).
+    """
+    def __init__(self, frame_index, track_id, position, frame_count=None):
+        """
+        Initialize the table from column arrays.
+
+        Args:
+            frame_index (array-like): Frame of each position.
+            track_id (array-like): Track ID of each position.
+            position (array-like): Position of each row, shape (N, 2).
+            frame_count (int): Number of frames covered.
+        """
+        order = self._set_rows(frame_index, track_id, frame_count)
+        self.position = np.asarray(position, dtype=np.float32).reshape(-1, 2)[order]
+
+    @classmethod
+    def from_frame_dicts(cls, positions):
+        """
+        Build a table from per-frame `{track_id: [x, y]}` dictionaries.
+
+        Args:
+            positions (list): One dictionary of positions per frame.
+
+        Returns:
+            PositionTable: The table covering len(positions) frames.
+        """
+        frame_index = []
+        track_ids = []
+        points = []
+        for frame_num, frame_positions in enumerate(positions):
+            for track_id, position in frame_positions.items():
+                frame_index.append(frame_num)
+                track_ids.append(track_id)
+                points.append(position)
+        return cls(frame_index, track_ids, np.asarray(points, dtype=np.float32).reshape(-1, 2), frame_count=len(positions))
+
+    def to_frame_dicts(self):
+        """
+        Returns:
+            list: One `{track_id: [x, y]}` dictionary per frame.
+        """
+        track_ids = self.track_id.tolist()
+        points = self.position.tolist()
+        return [{track_ids[row]: points[row] for row in range(self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1])}
+                for frame_num in range(self.frame_count)]
+
+    def get_track(self, track_id):
+        """
+        Get the frames and positions of one track.
+
+        Args:
+            track_id (int): The track ID.
+
+        Returns:
+            tuple: (frame_index, position) arrays of the track, in frame order.
+        """
+        rows = self.track_rows.get(track_id, np.empty(0, dtype=np.int64))
+        return self.frame_index[rows], self.position[rows]
@@ -1,24 +1,166 @@
+from collections import namedtuple
 import cv2
 import os
 
+FrameBatch = namedtuple('FrameBatch', ['start_index', 'frames', 'timestamps'])
+FrameBatch.__doc__ = """
+A contiguous run of decoded frames.
+
+Attributes:
+    start_index (int): Index of the first frame of the batch within the video.
+    frames (list): Frames of the batch as numpy arrays.
+    timestamps (list): Timestamp in seconds of each frame, or None when unknown.
+"""
+
+class VideoFrameSource:
+    """
+    A lazily decoded, re-iterable view of the frames of a video file.
+
+    Frames are decoded on demand instead of being materialized up front, so consumers
+    that work batch by batch only ever hold one batch of frames in memory. Every
+    iteration re-opens the video, which allows several stages to walk the same source.
+
+    Attributes:
+        video_path (str): Path to the input video file.
+        fps (float): Frames per second of the video.
+        frame_count (int): Number of frames in the video. The container's estimate until
+            frame_count_exact is set.
+        frame_count_exact (bool): Whether frame_count comes from a complete pass over the video.
+        width (int): Width of the frames in pixels.
+        height (int): Height of the frames in pixels.
+    """
+    def __init__(self, video_path, default_fps=30):
+        """
+        Open the video and read its metadata.
+
+        Args:
+            video_path (str): Path to the input video file.
+            default_fps (float): Frame rate to assume when the container does not report one.
+
+        Raises:
+            ValueError: If the video cannot be opened.
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Video {video_path} could not be opened.")
+
+        self.video_path = video_path
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or default_fps
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_count_exact = False
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+
+    def __len__(self):
+        return self.frame_count
+
+    def __iter__(self):
+        """
+        Decode the video frame by frame.
+
+        The frame count reported by the container is only an estimate for some codecs,
+        so it is corrected once a full pass over the video has completed.
+
+        Yields:
+            tuple: (frame_index, timestamp, frame) for every frame of the video.
+        """
+        cap = cv2.VideoCapture(self.video_path)
+        frame_index = 0
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame_index, frame_index / self.fps, frame
+                frame_index += 1
+            self.frame_count = frame_index
+            self.frame_count_exact = True
+        finally:
+            cap.release()
+
+    def count_frames(self):
+        """
+        Get the exact number of frames, walking the video once if no full pass has run yet.
+
+        Frames are grabbed without being converted to images, which is cheaper than a
+        decode through __iter__.
+
+        Returns:
+            int: The number of frames in the video.
+        """
+        if self.frame_count_exact:
+            return self.frame_count
+        cap = cv2.VideoCapture(self.video_path)
+        frame_count = 0
+        try:
+            while cap.grab():
+                frame_count += 1
+        finally:
+            cap.release()
+        self.frame_count = frame_count
+        self.frame_count_exact = True
+        return self.frame_count
+
+    def batches(self, batch_size=20):
+        """
+        Decode the video in batches of consecutive frames.
+
+        Args:
+            batch_size (int): Maximum number of frames per batch.
+
+        Yields:
+            FrameBatch: The next batch of frames with their index and timestamps.
+        """
+        start_index = 0
+        frames = []
+        timestamps = []
+        for frame_index, timestamp, frame in self:
+            if not frames:
+                start_index = frame_index
+            frames.append(frame)
+            timestamps.append(timestamp)
+            if len(frames) == batch_size:
+                yield FrameBatch(start_index, frames, timestamps)
+                frames = []
+                timestamps = []
+        if frames:
+            yield FrameBatch(start_index, frames, timestamps)
+
+def iter_frame_batches(frames, batch_size=20):
+    """
+    Iterate over frames in bounded-size batches.
+
+    Accepts either an in-memory list of frames or a VideoFrameSource, so stages can be
+    written once and consume both.
+
+    Args:
+        frames (list or VideoFrameSource): The frames to iterate over.
+        batch_size (int): Maximum number of frames per batch.
+
+    Yields:
+        FrameBatch: The next batch of frames. Timestamps are None for plain lists.
+    """
+    if isinstance(frames, VideoFrameSource):
+        yield from frames.batches(batch_size)
+        return
+
+    for i in range(0,len(frames),batch_size):
+        yield FrameBatch(i, frames[i:i+batch_size], None)
+
 def read_video(video_path):
     """
     Read all frames from a video file into memory.
 
+    Prefer VideoFrameSource for long videos, as this materializes every frame.
+
     Args:
         video_path (str): Path to the input video file.
 
     Returns:
         list: List of video frames as numpy arrays.
     """
-    cap = cv2.VideoCapture(video_path)
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    return frames
+    return [frame for _, _, frame in VideoFrameSource(video_path)]
 
 def save_video(ouput_video_frames,output_video_path):
     """
@@ -38,4 +180,4 @@ def save_video(ouput_video_frames,output_video_path):
     out = cv2.VideoWriter(output_video_path, fourcc, 24, (ouput_video_frames[0].shape[1], ouput_video_frames[0].shape[0]))
     for frame in ouput_video_frames:
         out.write(frame)
-    out.release()
\ No newline at end of file
+    out.release()
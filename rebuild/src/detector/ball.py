@@ -1,14 +1,10 @@
-from ultralytics import YOLO
 import supervision as sv
 
-import gc
 import logging
+import math
 import numpy as np
-import os
-import pandas as pd
-import psutil
-import torch
 
+from detector.model_registry import use_model
 from utils.detector_utils import get_center_of_bbox, measure_distance
 
 logger = logging.getLogger(__name__)
@@ -19,28 +15,14 @@ min_frames = 5
 containment_threshold = 0.8
 
 def detect_ball(frames,use_gpu=True):
-    process = psutil.Process(os.getpid())
-    ram_used = process.memory_info().rss / (1024 * 1024)     
-    logger.info(f"RAM used before model load {round(ram_used, 2)} MB")
-    # setup
-    device = 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
-
-    runtime_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(runtime_dir, '..', 'models', 'ball_detector_model.pt')
-
-    model = YOLO(model_path)
-    model.to(device)
-
-    ram_used = process.memory_info().rss / (1024 * 1024)     
-    logger.info(f"RAM used after model load  {round(ram_used, 2)} MB")
-
     logger.info("starting ball detections")
     # detect
     batch_size=20 
     detections = [] 
-    for i in range(0,len(frames),batch_size):
-        detections_batch = model.predict(frames[i:i+batch_size],conf=0.5)
-        detections += detections_batch
+    with use_model('ball',use_gpu) as model:
+        for i in range(0,len(frames),batch_size):
+            detections_batch = model.predict(frames[i:i+batch_size],conf=0.5)
+            detections += detections_batch
 
     tracks=[]
 
@@ -69,50 +51,138 @@ def detect_ball(frames,use_gpu=True):
             tracks[idx][1] = {"bbox":chosen_bbox}
     
     logger.info("done... returning")
-
-    # unload the model
-    gc.collect()
-
-    ram_used = process.memory_info().rss / (1024 * 1024)
-    logger.info(f"RAM used after model unloaded  {round(ram_used, 2)} MB")
-    # return
     return tracks
 
-def remove_wrong_detections(ball_tracks):
-    # set tolerances
-    maximum_allowed_distance = 25
-    last_good_frame_index = -1
-
-    for i in range(len(ball_tracks)):
-        current_box = ball_tracks[i].get(1,{}).get('bbox',[])
-        if len(current_box) == 0:
-            continue
-        
-        if last_good_frame_index == -1:
-            last_good_frame_index = i
-            continue
-
-        last_good_box = ball_tracks[last_good_frame_index].get(1,{}).get('bbox',[])
-        frame_gap = i - last_good_frame_index
-        adjusted_max_distance = maximum_allowed_distance * frame_gap # figure out the max distaance allowed
-
-        if np.linalg.norm(np.array(last_good_box[:2]) - np.array(current_box[:2])) > adjusted_max_distance: #linear algorithm for distance
-            ball_tracks[i] = {}
+def get_ball_array(ball_tracks):
+    # (N,4) float boxes with NaN where there is no ball, plus the mask of frames with one
+    positions = np.full((len(ball_tracks),4),np.nan)
+    valid = np.zeros(len(ball_tracks),dtype=bool)
+    for i,ball_track in enumerate(ball_tracks):
+        bbox = ball_track.get(1,{}).get('bbox',[])
+        if len(bbox) != 0:
+            positions[i] = bbox
+            valid[i] = True
+    return positions, valid
+
+def filter_jumps(positions,valid,maximum_allowed_distance=25,last_good=None):
+    # a detection is kept when it is within maximum_allowed_distance per elapsed frame of the
+    # last kept one. only valid frames are visited, with plain floats, so no per frame arrays.
+    # last_good is an optional (frame, x, y) kept before these positions, frame relative to them
+    valid = valid.copy()
+    frames = np.flatnonzero(valid)
+    if len(frames) == 0:
+        return valid
+    xs = positions[frames,0].tolist()
+    ys = positions[frames,1].tolist()
+    frames = frames.tolist()
+    if last_good is not None:
+        frames = [last_good[0]] + frames
+        xs = [last_good[1]] + xs
+        ys = [last_good[2]] + ys
+
+    last_good = 0
+    for i in range(1,len(frames)):
+        adjusted_max_distance = maximum_allowed_distance * (frames[i] - frames[last_good]) # figure out the max distaance allowed
+        dx = xs[last_good] - xs[i]
+        dy = ys[last_good] - ys[i]
+        if math.sqrt(dx*dx + dy*dy) > adjusted_max_distance: #linear algorithm for distance
+            valid[frames[i]] = False
         else:
-            last_good_frame_index = i
+            last_good = i
+    return valid
+
+def interpolate_positions(positions,valid):
+    # linear fill between valid frames, the ends take the nearest valid position
+    frames = np.flatnonzero(valid)
+    if len(frames) == 0:
+        return np.full((len(positions),4),np.nan)
+    all_frames = np.arange(len(positions))
+    return np.column_stack([np.interp(all_frames,frames,positions[frames,column]) for column in range(4)])
 
+def remove_wrong_detections(ball_tracks):
+    positions, valid = get_ball_array(ball_tracks)
+    kept = filter_jumps(positions,valid)
+    for i in np.flatnonzero(valid & ~kept).tolist():
+        ball_tracks[i] = {}
     return ball_tracks
 
 def refine(ball_tracks):
-    ball_tracks = [x.get(1,{}).get('bbox',[]) for x in ball_tracks]
-    df_ball_positions = pd.DataFrame(ball_tracks,columns=['x1','y1','x2','y2'])
-    #get missing values
-    df_ball_positions = df_ball_positions.interpolate()
-    df_ball_positions = df_ball_positions.bfill()
+    positions, valid = get_ball_array(ball_tracks)
+    positions = interpolate_positions(positions,valid)
     #reset
-    ball_tracks = [{1: {'bbox':x}} for x in df_ball_positions.to_numpy().tolist()]
+    ball_tracks = [{1: {'bbox':x}} for x in positions.tolist()]
     return ball_tracks
 
+class BallTrackRefiner:
+    # remove_wrong_detections + refine for streamed batches. the last kept detection is carried
+    # between batches and `latency` frames are held back, so a gap is interpolated once the ball
+    # is seen again. a frame whose next detection is more than `latency` frames away keeps the
+    # last position instead; with shorter gaps the output is the same as refining the whole video
+    def __init__(self,latency=100,maximum_allowed_distance=25):
+        self.latency = latency
+        self.maximum_allowed_distance = maximum_allowed_distance
+        self.reset()
+
+    def update(self,ball_tracks):
+        # add a batch of detections, returns the frames that are now final (possibly none)
+        positions, valid = get_ball_array(ball_tracks)
+        batch_start = self.start + len(self.positions)
+        last_good = None
+        if self.last_good is not None:
+            last_good = (self.last_good[0] - batch_start,self.last_good[1],self.last_good[2])
+        valid = filter_jumps(positions,valid,self.maximum_allowed_distance,last_good)
+        kept = np.flatnonzero(valid)
+        if len(kept):
+            self.last_good = (batch_start + int(kept[-1]),positions[kept[-1],0],positions[kept[-1],1])
+
+        self.positions = np.concatenate((self.positions,positions))
+        self.valid = np.concatenate((self.valid,valid))
+        return self.emit(max(len(self.positions) - self.latency,0))
+
+    def flush(self):
+        # end of the video, every held back frame is final
+        return self.emit(len(self.positions))
+
+    def emit(self,count):
+        if count == 0:
+            return []
+        frames = np.arange(self.start,self.start + len(self.positions))
+        anchor_frames = frames[self.valid]
+        anchor_positions = self.positions[self.valid]
+        if self.anchor is not None:
+            anchor_frames = np.concatenate(([self.anchor[0]],anchor_frames))
+            anchor_positions = np.vstack((self.anchor[1],anchor_positions))
+
+        emit_frames = frames[:count]
+        refined = [{} for _ in range(count)]
+        if len(anchor_frames):
+            interpolated = np.column_stack([np.interp(emit_frames,anchor_frames,anchor_positions[:,column]) for column in range(4)])
+            # closest detection at or before / at or after each frame, the one after must be in the look ahead
+            next_index = np.searchsorted(anchor_frames,emit_frames)
+            has_next = next_index < len(anchor_frames)
+            has_next[has_next] = anchor_frames[next_index[has_next]] - emit_frames[has_next] <= self.latency
+            previous_index = np.searchsorted(anchor_frames,emit_frames,side='right') - 1
+            has_previous = previous_index >= 0
+            hold = has_previous & ~has_next
+            interpolated[hold] = anchor_positions[previous_index[hold]]
+            for i in np.flatnonzero(has_previous | has_next).tolist():
+                refined[i] = {1: {'bbox':interpolated[i].tolist()}}
+
+        emitted_valid = np.flatnonzero(self.valid[:count])
+        if len(emitted_valid):
+            self.anchor = (self.start + int(emitted_valid[-1]),self.positions[emitted_valid[-1]])
+        self.positions = self.positions[count:]
+        self.valid = self.valid[count:]
+        self.start += count
+        return refined
+
+    def reset(self):
+        self.last_good = None # (frame, x, y) the jump filter compares against
+        self.anchor = None # (frame, bbox) last detection already emitted
+        self.start = 0 # frame number of the first held back frame
+        self.positions = np.empty((0,4))
+        self.valid = np.empty(0,dtype=bool)
+
 # calculate how close the ball is the to the players box
 def calculate_ball_containment_ratio(player_bbox,ball_bbox):
     px1, py1, px2, py2 = player_bbox
@@ -200,14 +270,14 @@ def find_best_candidate_for_possession(ball_center,player_frame,ball_bbox):
     return -1    
 
 def detect_possession(player_tracks,ball_tracks):
-    # init
+    # works on any iterables of frames so artifacts can be streamed from disk
     global min_frames #TODO remove global
-    num_frames = len(ball_tracks)
-    position_list = [-1] * num_frames #create list
+    position_list = []
     consecutive_possession_count = {}
 
-    for frame_num in range(num_frames):
-        ball_info = ball_tracks[frame_num].get(1,{})
+    for player_frame, ball_frame in zip(player_tracks,ball_tracks):
+        position_list.append(-1)
+        ball_info = ball_frame.get(1,{})
         if not ball_info:
             continue
         
@@ -218,7 +288,7 @@ def detect_possession(player_tracks,ball_tracks):
         ball_center = get_center_of_bbox(ball_bbox)
 
 
-        best_player_id = find_best_candidate_for_possession(ball_center,player_tracks[frame_num],ball_bbox)
+        best_player_id = find_best_candidate_for_possession(ball_center,player_frame,ball_bbox)
 
         if best_player_id != -1:
             # got a hit --> update the count
@@ -227,50 +297,45 @@ def detect_possession(player_tracks,ball_tracks):
 
             if consecutive_possession_count[best_player_id] >= min_frames:
                 logger.info("greater than min frames")
-                position_list[frame_num] = best_player_id
+                position_list[-1] = best_player_id
         else:
             consecutive_possession_count = {}
     
     return position_list # final list
 
-def detect_passes(possession_list,teams_list):
-    passes = [-1] * len(possession_list)
+def iter_possession_changes(possession_list,teams_list):
+    # yields (frame, previous team, current team) whenever the ball moves to another player,
+    # the previous holder's team is looked up on the last frame they held the ball
     prev_holder = -1
-    previous_frame = -1
+    prev_team = -1
+    previous_possession = -1
+    previous_teams = {}
 
-    for frame in range(1,len(possession_list)):
-        if possession_list[frame -1] != -1:
-            prev_holder = possession_list[frame - 1]
-            previous_frame = frame -1
-        
-        current_holder = possession_list[frame]
+    for frame, (current_holder, teams) in enumerate(zip(possession_list,teams_list)):
+        if frame > 0 and previous_possession != -1:
+            prev_holder = previous_possession
+            prev_team = previous_teams.get(prev_holder, -1)
 
         if prev_holder != -1 and current_holder != -1 and prev_holder != current_holder:
-            prev_team = teams_list[previous_frame].get(prev_holder, -1)
-            current_team = teams_list[frame].get(current_holder,-1)
+            yield frame, prev_team, teams.get(current_holder,-1)
+
+        previous_possession = current_holder
+        previous_teams = teams
+
+def detect_passes(possession_list,teams_list):
+    passes = [-1] * len(possession_list)
 
-            if prev_team == current_team and prev_team != -1:
-                passes[frame] = prev_team
+    for frame, prev_team, current_team in iter_possession_changes(possession_list,teams_list):
+        if prev_team == current_team and prev_team != -1:
+            passes[frame] = prev_team
     
     return passes
 
 def detect_interceptions(possession_list,teams_list):
     interceptions = [-1] * len(possession_list)
-    prev_holder = -1
-    previous_frame = -1
-
-    for frame in range(1,len(possession_list)):
-        if possession_list[frame -1] != -1:
-            prev_holder = possession_list[frame - 1]
-            previous_frame = frame -1
-        
-        current_holder = possession_list[frame]
-
-        if prev_holder != -1 and current_holder != -1 and prev_holder != current_holder:
-            prev_team = teams_list[previous_frame].get(prev_holder, -1)
-            current_team = teams_list[frame].get(current_holder,-1)
 
-            if prev_team != current_team and prev_team != -1 and current_team != -1:
-                interceptions[frame] = prev_team
+    for frame, prev_team, current_team in iter_possession_changes(possession_list,teams_list):
+        if prev_team != current_team and prev_team != -1 and current_team != -1:
+            interceptions[frame] = prev_team
     
     return interceptions
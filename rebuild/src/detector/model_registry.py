@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+
+import gc
+import logging
+import os
+import psutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+runtime_dir = os.path.dirname(os.path.abspath(__file__))
+
+model_paths = {
+    'players': os.path.join(runtime_dir, '..', 'models', 'player_detector.pt'),
+    'ball': os.path.join(runtime_dir, '..', 'models', 'ball_detector_model.pt'),
+    'court': os.path.join(runtime_dir, '..', 'models', 'court_keypoint_detector.pt'),
+    'clip': os.path.join(runtime_dir, '..', 'models', 'patrickjohncyh', 'fashion-clip'),
+}
+# models the service's jobs load, the court model is only used by the app
+job_models = ('players','ball','clip')
+
+# resident memory (MB) above which least recently used models are unloaded, 0 disables
+memory_limit_mb = int(os.environ.get('MODEL_MEMORY_LIMIT_MB', '0'))
+
+loaded_models = {} # name -> model
+last_used = {} # name -> monotonic timestamp
+model_locks = {name: threading.Lock() for name in model_paths}
+load_locks = {name: threading.Lock() for name in model_paths}
+registry_lock = threading.RLock()
+
+# models that failed to load in the last warm up, read by the scheduler
+warm_up_errors = {} # name -> error message
+
+def get_ram_used():
+    process = psutil.Process(os.getpid())
+    return process.memory_info().rss / (1024 * 1024)
+
+def load_yolo(path,use_gpu):
+    # torch and ultralytics are imported on first load, keeping them out of processes that never detect
+    import torch
+    from ultralytics import YOLO
+    device = 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
+    model = YOLO(path)
+    model.to(device)
+    return model
+
+def load_clip(path,use_gpu):
+    # CLIP stays on the cpu, its inputs are built there by the processor
+    from transformers import CLIPProcessor, CLIPModel
+    model = CLIPModel.from_pretrained(path)
+    model.eval()
+    processor = CLIPProcessor.from_pretrained(path)
+    return model, processor
+
+model_loaders = {
+    'players': load_yolo,
+    'ball': load_yolo,
+    'court': load_yolo,
+    'clip': load_clip,
+}
+
+def get_model(name,use_gpu=True):
+    # load lazily on first use, then keep it warm for every later batch and job.
+    # each model has its own load lock so threads asking for a loaded model never
+    # wait behind another model being loaded
+    if name not in model_paths:
+        raise KeyError(f"unknown model {name}")
+    model = loaded_models.get(name)
+    if model is None:
+        with load_locks[name]:
+            model = loaded_models.get(name)
+            if model is None:
+                evict_if_needed(keep=name)
+                logger.info(f"RAM used before loading {name} model {round(get_ram_used(), 2)} MB")
+                model = model_loaders[name](model_paths[name],use_gpu)
+                with registry_lock:
+                    loaded_models[name] = model
+                logger.info(f"RAM used after loading {name} model {round(get_ram_used(), 2)} MB")
+    with registry_lock:
+        last_used[name] = time.monotonic()
+    return model
+
+@contextmanager
+def use_model(name,use_gpu=True):
+    # a YOLO instance is not safe to share between concurrent predictions, so serialise per model
+    model = get_model(name,use_gpu)
+    with model_locks[name]:
+        yield model
+
+def unload_model(name):
+    with registry_lock:
+        model = loaded_models.pop(name,None)
+        last_used.pop(name,None)
+    if model is None:
+        return False
+    del model
+    gc.collect()
+    import torch
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    logger.info(f"unloaded {name} model, RAM used {round(get_ram_used(), 2)} MB")
+    return True
+
+def unload_all():
+    for name in list(loaded_models):
+        unload_model(name)
+
+def evict_if_needed(keep=None):
+    # drop least recently used models until the process is back under the memory limit
+    if memory_limit_mb <= 0:
+        return
+    with registry_lock:
+        candidates = sorted((ts,name) for name,ts in last_used.items() if name != keep)
+        for _,name in candidates:
+            if get_ram_used() <= memory_limit_mb:
+                break
+            logger.info(f"RAM above {memory_limit_mb} MB, evicting {name} model")
+            unload_model(name)
+
+def get_loaded_models():
+    with registry_lock:
+        return list(loaded_models)
+
+def warm_up(names=None,use_gpu=True):
+    # load the named models, all by default, up front so the first job does not pay for them; safe to call repeatedly
+    for name in names or model_paths:
+        try:
+            get_model(name,use_gpu)
+            warm_up_errors.pop(name,None)
+        except Exception as e:
+            logger.exception(f"warm up of {name} model failed")
+            warm_up_errors[name] = str(e)
+    return get_loaded_models()
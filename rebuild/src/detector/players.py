@@ -1,74 +1,62 @@
-from ultralytics import YOLO
 import supervision as sv
 
-import gc
 import logging
-import os
-import psutil
-import torch
 
-logger = logging.getLogger(__name__)
-
-def detect_players(frames,use_gpu=True):
-    process = psutil.Process(os.getpid())
-    ram_used = process.memory_info().rss / (1024 * 1024)     
-    logger.info(f"RAM used before model load {round(ram_used, 2)} MB")
-
-    device = 'cuda' if use_gpu and torch.cuda.is_available() else 'cpu'
-
-    runtime_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(runtime_dir, '..','models', 'player_detector.pt')
-
-    model = YOLO(model_path)
-    model.to(device)
-    tracker = sv.ByteTrack()
-
-    ram_used = process.memory_info().rss / (1024 * 1024)     
-    logger.info(f"RAM used after model load  {round(ram_used, 2)} MB")
-
-    logger.info("starting player detections")
-
-    batch_size=20 
-    detections = [] 
-    for i in range(0,len(frames),batch_size):
-        detections_batch = model.predict(frames[i:i+batch_size],conf=0.5)
-        detections += detections_batch
-
-    logger.info("detections complete")
+from detector.model_registry import use_model
 
-    tracks = []
-
-    # for idx, frame in enumerate(frames):
-    for idx, frame in enumerate(detections):
-        class_names = frame.names
-        class_names_inverted = {v:k for k,v in class_names.items()}
-        # print("now supervised...")
-        supervised = sv.Detections.from_ultralytics(frame)
-        # get tracks
-        detection_with_tracks = tracker.update_with_detections(supervised)
-
-        tracks.append({})
-        
-
-        for frame_detection in detection_with_tracks:            
-            #bounding box
-            bbox = frame_detection[0].tolist()
-            #detected id
-            class_id = frame_detection[3]
-            track_id = frame_detection[4] # this is the player id
-            # validate that this is tracking a PLAYER
-            if class_id == class_names_inverted['Player']:
-                tracks[idx][track_id] = bbox
-    
-    logger.info("done... returning")
-
-    # unload the model
-    gc.collect()
-
-    ram_used = process.memory_info().rss / (1024 * 1024)
-    logger.info(f"RAM used after model unloaded  {round(ram_used, 2)} MB")
-
-
-    return tracks
+logger = logging.getLogger(__name__)
 
-    
+class PlayerTrackingSession:
+    # carries the ByteTrack state across streamed batches so a player keeps the same
+    # track id for the whole job, just like tracking the whole video in one go
+    def __init__(self,use_gpu=True):
+        self.use_gpu = use_gpu
+        self.tracker = sv.ByteTrack()
+        self.frames_seen = 0
+
+    def update(self,frames):
+        logger.info(f"starting player detections from frame {self.frames_seen}")
+
+        batch_size=20 
+        detections = [] 
+        with use_model('players',self.use_gpu) as model:
+            for i in range(0,len(frames),batch_size):
+                detections_batch = model.predict(frames[i:i+batch_size],conf=0.5)
+                detections += detections_batch
+
+        logger.info("detections complete")
+
+        tracks = []
+        for idx, frame in enumerate(detections):
+            class_names = frame.names
+            class_names_inverted = {v:k for k,v in class_names.items()}
+            supervised = sv.Detections.from_ultralytics(frame)
+            # get tracks
+            detection_with_tracks = self.tracker.update_with_detections(supervised)
+
+            tracks.append({})
+
+            for frame_detection in detection_with_tracks:            
+                #bounding box
+                bbox = frame_detection[0].tolist()
+                #detected id
+                class_id = frame_detection[3]
+                track_id = frame_detection[4] # this is the player id
+                # validate that this is tracking a PLAYER
+                if class_id == class_names_inverted['Player']:
+                    tracks[idx][track_id] = bbox
+
+        self.frames_seen += len(frames)
+        logger.info("done... returning")
+
+        return tracks
+
+    def reset(self):
+        self.tracker.reset()
+        self.frames_seen = 0
+
+def detect_players(frames,use_gpu=True,session=None):
+    # without a session the tracker starts fresh, so ids are only stable within these frames
+    if session is None:
+        session = PlayerTrackingSession(use_gpu)
+    return session.update(frames)
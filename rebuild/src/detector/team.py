@@ -1,77 +1,113 @@
 from PIL import Image
 import cv2
-from transformers import CLIPProcessor, CLIPModel
+import torch
 
 import logging
-import os
 
-logger = logging.getLogger(__name__)
-
-team_colors = {}
-player_team_dict = {}
+from detector.model_registry import use_model
 
-runtime_dir = os.path.dirname(os.path.abspath(__file__))
-# local_model_dir = os.path.join(runtime_dir, "patrickjohncyh/fashion-clip")
+logger = logging.getLogger(__name__)
 
-model_path = os.path.join(runtime_dir, '..', 'models', 'patrickjohncyh', 'fashion-clip')
+# normalised prompt embeddings keyed by (team_1_class_name, team_2_class_name)
+text_embeddings = {}
+# crops embedded per forward pass
+clip_batch_size = 32
+# the CLIP model and processor are loaded by the model registry on first use
 
-# model = CLIPModel.from_pretrained("patrickjohncyh/fashion-clip")
-model = CLIPModel.from_pretrained(model_path)
-# processor = CLIPProcessor.from_pretrained("patrickjohncyh/fashion-clip")
-processor = CLIPProcessor.from_pretrained(model_path)
 
+def get_text_embeddings(model,processor,team_1_class_name,team_2_class_name):
+    # the prompts never change during a job, encode them once
+    key = (team_1_class_name,team_2_class_name)
+    if key not in text_embeddings:
+        inputs = processor(text=list(key), return_tensors="pt", padding=True)
+        with torch.no_grad():
+            embeddings = model.get_text_features(**inputs)
+        text_embeddings[key] = embeddings / embeddings.norm(dim=-1, keepdim=True)
+    return text_embeddings[key]
 
-def get_player_color(frame,bbox,team_1_class_name,team_2_class_name):
+def get_player_crop(frame,bbox):
     image = frame[int(bbox[1]):int(bbox[3]),int(bbox[0]):int(bbox[2])]
 
     # Convert to PIL Image
     rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(rgb_image)
-    image = pil_image
+    return Image.fromarray(rgb_image)
 
+def classify_crops(crops,team_1_class_name,team_2_class_name):
+    # same scoring as the CLIP forward pass, but with cached prompts and batched images
     classes = [team_1_class_name, team_2_class_name]
-
-    inputs = processor(text=classes, images=image, return_tensors="pt", padding=True)
-
-    outputs = model(**inputs)
-    logits_per_image = outputs.logits_per_image
-    probs = logits_per_image.softmax(dim=1)   
-
-    class_name = classes[probs.argmax(dim=1)[0]]
-
-    return class_name      
-
-
-def get_player_team(frame,player_bbox,player_id,team_1_class_name,team_2_class_name):
-    global player_team_dict
-    # check
-    if player_id in player_team_dict:
-        return player_team_dict[player_id]
-
-    player_color = get_player_color(frame,player_bbox,team_1_class_name,team_2_class_name)
-
+    class_names = []
+    with use_model('clip') as (model, processor):
+        prompts = get_text_embeddings(model,processor,team_1_class_name,team_2_class_name)
+        logit_scale = model.logit_scale.exp()
+        for i in range(0,len(crops),clip_batch_size):
+            inputs = processor(images=crops[i:i+clip_batch_size], return_tensors="pt")
+            with torch.no_grad():
+                image_embeddings = model.get_image_features(**inputs)
+            image_embeddings = image_embeddings / image_embeddings.norm(dim=-1, keepdim=True)
+            probs = (logit_scale * image_embeddings @ prompts.t()).softmax(dim=1)
+            class_names += [classes[idx] for idx in probs.argmax(dim=1).tolist()]
+
+    return class_names
+
+def get_team_id(player_color,team_1_class_name):
     team_id=2
     if player_color==team_1_class_name:
         team_id=1
-
-    player_team_dict[player_id] = team_id
     return team_id
 
-
-def get_team_assignment(frames,player_tracks,team_1_class_name,team_2_class_name):
-    global player_team_dict
-    # load the model
-
-    player_assignment = []
-    for frame_num, player_track in enumerate(player_tracks):
-        player_assignment.append({})
-
-        if frame_num %50 == 0:
-            player_team_dict = {}
-        
-        for player_id, track in player_track.items():
-            team = get_player_team(frames[frame_num],track,player_id,team_1_class_name,team_2_class_name)
-            player_assignment[frame_num][player_id] = team
-
-    return player_assignment
-
+class TeamAssignmentSession:
+    # one per job: owns the player -> team cache and the frame count, so jobs on
+    # different threads never see each other's players. the cache is cleared every
+    # window_size frames of the job, not of the batch, so a player first classified
+    # in one batch keeps their team in the next batches of the same window
+    def __init__(self,team_1_class_name,team_2_class_name,window_size=50):
+        self.team_1_class_name = team_1_class_name
+        self.team_2_class_name = team_2_class_name
+        self.window_size = window_size
+        self.player_team_dict = {}
+        self.frames_seen = 0
+
+    def classify_pending(self,pending_crops):
+        if not pending_crops:
+            return
+        player_ids = list(pending_crops.keys())
+        player_colors = classify_crops(list(pending_crops.values()),self.team_1_class_name,self.team_2_class_name)
+        for player_id, player_color in zip(player_ids,player_colors):
+            self.player_team_dict[player_id] = get_team_id(player_color,self.team_1_class_name)
+
+    def update(self,frames,player_tracks):
+        # collect a crop for every player first seen in the window and classify them
+        # together, rather than one CLIP call per player. every frame of the batch is
+        # resolved before returning so the output lines up with the batch
+        window_frames = []
+        pending_crops = {}
+
+        player_assignment = []
+        for offset, player_track in enumerate(player_tracks):
+            if (self.frames_seen + offset) % self.window_size == 0:
+                self.classify_pending(pending_crops)
+                player_assignment += [{player_id: self.player_team_dict[player_id] for player_id in ids} for ids in window_frames]
+                window_frames = []
+                pending_crops = {}
+                self.player_team_dict = {}
+
+            for player_id, track in player_track.items():
+                if player_id not in self.player_team_dict and player_id not in pending_crops:
+                    pending_crops[player_id] = get_player_crop(frames[offset],track)
+            window_frames.append(list(player_track.keys()))
+
+        self.classify_pending(pending_crops)
+        player_assignment += [{player_id: self.player_team_dict[player_id] for player_id in ids} for ids in window_frames]
+
+        self.frames_seen += len(player_tracks)
+        return player_assignment
+
+    def reset(self):
+        self.player_team_dict = {}
+        self.frames_seen = 0
+
+def get_team_assignment(frames,player_tracks,team_1_class_name,team_2_class_name,session=None):
+    # without a session the cache starts empty, so teams are only reused within these frames
+    if session is None:
+        session = TeamAssignmentSession(team_1_class_name,team_2_class_name)
+    return session.update(frames,player_tracks)
@@ -1,6 +1,6 @@
 from service.processor import process_frames_for_ball_stream
 from utils.file_tools import get_list
-from utils.frame_tools import write_frame
+from utils.frame_tools import write_frame, get_frames
 
 import cv2
 import pickle
@@ -9,7 +9,7 @@ def images():
     # load up the frames pickle
     # pick one and dump it out
     # see if it comes to an image
-    frames = get_list('./frames.pkl')    
+    frames = get_frames('./frames.raw')
     tracks = get_list('./tracks.pkl')
     print(f"frames {len(frames)} tracks {len(tracks)}")
     # write_frame(frames[0],"./frame_0.jpg")
@@ -70,7 +70,7 @@ def build_player_model():
 
 
 def fix_ball():
-    process_frames_for_ball_stream('./frames.pkl','./ball.pkl')
+    process_frames_for_ball_stream('./frames.raw','./ball.pkl')
     
 
 
@@ -39,12 +39,12 @@ from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 import logging
 import os
-import tempfile
-import threading
 
 from logging_config import setup_logging
-from service.processor import process, process_from_files, process_player_team
-from service.registry import save,get_by_id
+from service.registry import save,get_by_id,update_status,mark_interrupted
+from service.results import process_player_team
+from service.scheduler import get_scheduler, QueueFullError, warm_up_on_start
+from service.workspace import JobWorkspace, purge_expired
 
 setup_logging()
 
@@ -62,23 +62,42 @@ def upload_video():
     file = request.files['file'] # get the video
     if file.filename == '':
         return 'No selected file',400
+    # reject early when every queue slot is taken
+    scheduler = get_scheduler()
+    if scheduler.is_full():
+        return jsonify({'status':'queue_full','queueDepth':scheduler.get_queue_depth()}),429
+    # lower values are processed first
+    priority = request.form.get('priority',0,type=int)
     # create a file name
     filename = secure_filename(file.filename)
-    # save
-    with tempfile.NamedTemporaryFile(delete=False,suffix=os.path.splitext(filename)[1]) as temp_file:
-        file.save(temp_file)
-        temp_path = temp_file.name
-
     # register
     registration_id = save(filename)
-    # process
-    thread = threading.Thread(target=process,args=(temp_path,registration_id,))
-    thread.daemon = True
-    thread.start()
+    # save into the job's own workspace
+    workspace = JobWorkspace(registration_id).create()
+    video_path = workspace.video_path(os.path.splitext(filename)[1])
+    file.save(video_path)
+    # queue for processing
+    try:
+        scheduler.submit(video_path,registration_id,priority)
+    except QueueFullError:
+        update_status(registration_id,'rejected')
+        workspace.delete()
+        return jsonify({'status':'queue_full','queueDepth':scheduler.get_queue_depth()}),429
 
     return jsonify({'registrationId':registration_id}),200
     # return f'Saved {registration_id}',200
 
+@app.route('/ready',methods=['GET'])
+def check_ready():
+    # 503 until the workers have their models loaded, so a load balancer can hold traffic back
+    scheduler = get_scheduler()
+    response = scheduler.get_warm_up_progress()
+    if not scheduler.is_ready():
+        response['status'] = 'warming_up'
+        return jsonify(response),503
+    response['status'] = 'ready'
+    return jsonify(response),200
+
 @app.route('/<registration_id>/status',methods=['GET'])
 def check_progress(registration_id):
     logger.info(f"registration id {registration_id}")
@@ -86,7 +105,16 @@ def check_progress(registration_id):
     if registration is None:
         return jsonify({'status':'not_found'}),404
     # need to check the status
-    return jsonify({'status':registration['status']}),200
+    scheduler = get_scheduler()
+    response = {
+        'status':registration['status'],
+        'updatedAt':registration['updated_at'],
+        'queueDepth':scheduler.get_queue_depth(),
+    }
+    queue_position = scheduler.get_queue_position(registration_id)
+    if queue_position is not None:
+        response['queuePosition'] = queue_position
+    return jsonify(response),200
     # if is_running:
     #     return jsonify({'status':'still_processing'}),200
     # return jsonify({'status':'complete'}),200
@@ -102,6 +130,11 @@ def retrieve_player_teams(registration_id):
 
 
 if __name__ == "__main__":
+    purge_expired()
+    mark_interrupted()
+    scheduler = get_scheduler()
+    if warm_up_on_start:
+        scheduler.warm_up()
     app.run(host="0.0.0.0",port=5000)
     # process_from_files()
 
@@ -1,11 +1,12 @@
-from detector.ball import detect_ball, remove_wrong_detections, refine, detect_possession, detect_passes, detect_interceptions
-from detector.players import detect_players
-from detector.team import get_team_assignment
-from utils.frame_tools import save_frames
-from utils.file_tools import get_list
+from detector.ball import detect_ball, detect_possession, detect_passes, detect_interceptions, BallTrackRefiner
+from detector.players import detect_players, PlayerTrackingSession
+from detector.team import get_team_assignment, TeamAssignmentSession
+from utils.frame_tools import save_frames, get_frames
+from utils.file_tools import get_list, ArtifactWriter, RecordStream
 from service.registry import update_status
+from service.workspace import JobWorkspace
 
-import pickle
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
 
@@ -16,41 +17,39 @@ logger = logging.getLogger(__name__)
 team_1_class_name = "white shirt"
 team_2_class_name = "dark blue shirt"
 
-def process(video_location,registration_id,frame_location="./frames.pkl",track_location="./tracks.pkl",ball_location="./ball.pkl",teams_location="./teams.pkl"):
-    logging.info("starting to process video to frames")
-    update_status(registration_id,"getting frames")
-    save_frames(video_location,frame_location)
-    logging.info("done")
-    logging.info("starting to process frames to player tracks")
-    update_status(registration_id,"getting players")
-    process_frames_to_tracks_stream(frame_location,track_location,teams_location)
-    logging.info("done")
-    logging.info("starting to process frames to ball tracks")
-    update_status(registration_id,"getting possessions")
-    process_frames_for_ball_stream(frame_location,ball_location)
-    logging.info("done")
-    # now we have the ball track and player tracks, get the stats together
-    player_tracks = get_list(track_location)
-    ball_tracks = get_list(ball_location)
-    team_tracks = get_list(teams_location)
-    # get teams
-    possession_list = detect_possession(player_tracks,ball_tracks)
-    # possession list shows who had possession of the ball (player_id) in each frame
-    passes = detect_passes(possession_list,team_tracks)
-    interceptions = detect_interceptions(possession_list,team_tracks)
-
-def process_player_team(registration_id):
-    playerframe = pd.DataFrame(columns=['player_id','team_id'])
-    # player_tracks = get_list(f"./tracks.{registration_id}.pkl")
-    team_tracks = get_list(f"./teams.{registration_id}.pkl")
-    # loop and process
-    for frame_num,team_track in enumerate(team_tracks):
-        for tk,tv in team_track.items():
-            if tk not in playerframe['player_id'].values:
-                new_player = pd.DataFrame({'player_id':[tk],'team_id':[tv]})
-                playerframe = pd.concat([playerframe,new_player],ignore_index=True)
-    json_str = playerframe.to_json(orient='records',index=False)
-    return json_str
+def process(video_location,registration_id):
+    workspace = JobWorkspace(registration_id).create()
+    try:
+        workspace.record_artifact('video',video_location)
+        frame_location = workspace.artifact_path('frames')
+        track_location = workspace.artifact_path('tracks')
+        ball_location = workspace.artifact_path('ball')
+        teams_location = workspace.artifact_path('teams')
+
+        logging.info("starting to process video to frames")
+        update_status(registration_id,"getting frames")
+        save_frames(video_location,frame_location)
+        workspace.record_artifact('frames')
+        logging.info("done")
+        logging.info("starting to process frames to player and ball tracks")
+        update_status(registration_id,"getting players")
+        process_frames_stream(frame_location,track_location,ball_location,teams_location)
+        for name in ('tracks','ball','teams'):
+            workspace.record_artifact(name)
+        logging.info("done")
+        update_status(registration_id,"getting possessions")
+        # now we have the ball track and player tracks, get the stats together
+        player_tracks = RecordStream(track_location)
+        ball_tracks = RecordStream(ball_location)
+        team_tracks = RecordStream(teams_location)
+        # get teams
+        possession_list = detect_possession(player_tracks,ball_tracks)
+        # possession list shows who had possession of the ball (player_id) in each frame
+        passes = detect_passes(possession_list,team_tracks)
+        interceptions = detect_interceptions(possession_list,team_tracks)
+    finally:
+        # frames and the upload are only needed while detecting, drop them even when the job failed
+        workspace.cleanup_intermediates()
 
 def process_from_files():
     dataframe = pd.DataFrame(columns=['frame_num','player_count','ball'])
@@ -93,31 +92,61 @@ def process_from_files():
     
 
 
+def detect_players_and_teams(frames,session,team_session):
+    tracks = detect_players(frames,session=session)
+    assignments = get_team_assignment(frames,tracks,team_1_class_name,team_2_class_name,session=team_session)
+    return tracks, assignments
+
+def detect_ball_batch(frames):
+    # filtering and interpolation need the neighbouring batches, they run in the job's BallTrackRefiner
+    return detect_ball(frames)
+
+def process_frames_stream(frame_location,track_location,ball_location,teams_location):
+    # read each batch of frames once and fan it out to the player and ball detectors
+    session = PlayerTrackingSession()
+    team_session = TeamAssignmentSession(team_1_class_name,team_2_class_name)
+    ball_refiner = BallTrackRefiner()
+    frame_store = get_frames(frame_location)
+    with ArtifactWriter(track_location) as tracks_out, ArtifactWriter(ball_location) as balls_out, ArtifactWriter(teams_location) as teams_out, ThreadPoolExecutor(max_workers=2) as executor:
+        for start, frames in frame_store.batches():
+            logger.info(f"processing a batch from frame {start}: frames to tracks and ball location")
+            players_future = executor.submit(detect_players_and_teams,frames,session,team_session)
+            balls_future = executor.submit(detect_ball_batch,frames)
+            tracks, assignments = players_future.result()
+            balls = ball_refiner.update(balls_future.result())
+            tracks_out.write(tracks)
+            teams_out.write(assignments)
+            # the refiner lags behind the detections, only write the frames it has finalised
+            if balls:
+                balls_out.write(balls)
+            logger.info("written a batch")
+        balls = ball_refiner.flush()
+        if balls:
+            balls_out.write(balls)
+
 def process_frames_to_tracks_stream(frame_location,track_location,teams_location):
-    with open(frame_location,'rb') as frames_in, open(track_location,'wb') as tracks_out, open(teams_location,'wb') as teams_out:
-        while True:
-            try:
-                logger.info("loading a batch: frames to tracks")
-                frames = pickle.load(frames_in) # get a batch
-                tracks = detect_players(frames)
-                pickle.dump(tracks,tracks_out)
-                assignments = get_team_assignment(frames,tracks,team_1_class_name,team_2_class_name)
-                pickle.dump(assignments,teams_out)
-                logger.info("written a batch")
-            except EOFError:
-                break
+    session = PlayerTrackingSession()
+    team_session = TeamAssignmentSession(team_1_class_name,team_2_class_name)
+    frame_store = get_frames(frame_location)
+    with ArtifactWriter(track_location) as tracks_out, ArtifactWriter(teams_location) as teams_out:
+        for start, frames in frame_store.batches():
+            logger.info(f"processing a batch from frame {start}: frames to tracks")
+            tracks = detect_players(frames,session=session)
+            tracks_out.write(tracks)
+            assignments = get_team_assignment(frames,tracks,team_1_class_name,team_2_class_name,session=team_session)
+            teams_out.write(assignments)
+            logger.info("written a batch")
 
 def process_frames_for_ball_stream(frame_location,ball_location):
-    with open(frame_location,'rb') as frames_in, open(ball_location,'wb') as tracks_out:
-        while True:
-            try:
-                logger.info("loading a batch: ball location")
-                frames = pickle.load(frames_in) # get a batch
-                balls = detect_ball(frames)
-                balls = remove_wrong_detections(balls)
-                # balls = refine(balls) TODO fix
-                pickle.dump(balls,tracks_out)
-                logger.info("written a batch")
-            except EOFError:
-                break       
-
+    ball_refiner = BallTrackRefiner()
+    frame_store = get_frames(frame_location)
+    with ArtifactWriter(ball_location) as tracks_out:
+        for start, frames in frame_store.batches():
+            logger.info(f"processing a batch from frame {start}: ball location")
+            balls = ball_refiner.update(detect_ball(frames))
+            if balls:
+                tracks_out.write(balls)
+            logger.info("written a batch")
+        balls = ball_refiner.flush()
+        if balls:
+            tracks_out.write(balls)
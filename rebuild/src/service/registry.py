@@ -1,41 +1,114 @@
 import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
 import uuid
 
 logger = logging.getLogger(__name__)
 
-movie_register = []
+# shared by the web process and every worker process
+registry_path = os.environ.get('REGISTRY_DB',os.path.join(tempfile.gettempdir(),'basketball-registry.db'))
 
 # status
 # 'new'
+# 'queued'
 # 'getting frames'
 # 'getting players'
 # 'getting possessions'
+# 'complete'
+# 'failed'
+# 'rejected'
+# 'interrupted'
+
+finished_statuses = ('complete','failed','rejected','interrupted')
+
+schema = """
+CREATE TABLE IF NOT EXISTS registrations (
+    registration_id TEXT PRIMARY KEY,
+    file_location TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS status_history (
+    registration_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS status_history_registration_id ON status_history (registration_id, changed_at);
+"""
+
+local = threading.local()
+
+def get_connection():
+    # sqlite connections must not cross threads, so keep one per thread (and per process)
+    connection = getattr(local,'connection',None)
+    if connection is None:
+        connection = sqlite3.connect(registry_path,timeout=30)
+        connection.row_factory = sqlite3.Row
+        # WAL lets status polling read while workers write
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(schema)
+        local.connection = connection
+    return connection
 
 def save(file_name):
-    registration_uuid = uuid.uuid4()
-    movie_registration = {
-        'registration_id': str(registration_uuid),
-        'file_location': file_name,
-        'status':'new'
-    }
-    # save
-    movie_register.append(movie_registration)
-    # return
-    return str(registration_uuid)
+    registration_id = str(uuid.uuid4())
+    now = time.time()
+    connection = get_connection()
+    with connection:
+        connection.execute(
+            "INSERT INTO registrations (registration_id, file_location, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (registration_id,file_name,'new',now,now),
+        )
+        connection.execute(
+            "INSERT INTO status_history (registration_id, status, changed_at) VALUES (?, ?, ?)",
+            (registration_id,'new',now),
+        )
+    return registration_id
 
 def get_by_id(registration_id):
     logger.debug(registration_id)
-    for _,movie_registration in enumerate(movie_register):
-        if movie_registration['registration_id'] == registration_id:
-            return movie_registration
-    return None #oops
+    row = get_connection().execute(
+        "SELECT registration_id, file_location, status, created_at, updated_at FROM registrations WHERE registration_id = ?",
+        (registration_id,),
+    ).fetchone()
+    if row is None:
+        return None #oops
+    return dict(row)
+
+def get_status_history(registration_id):
+    rows = get_connection().execute(
+        "SELECT status, changed_at FROM status_history WHERE registration_id = ? ORDER BY changed_at, rowid",
+        (registration_id,),
+    ).fetchall()
+    return [dict(row) for row in rows]
 
 def update_status(registration_id,status):
-    for idx,movie_registration in enumerate(movie_register):
-        if movie_registration['registration_id'] == registration_id:
+    now = time.time()
+    connection = get_connection()
+    with connection:
+        updated = connection.execute(
+            "UPDATE registrations SET status = ?, updated_at = ? WHERE registration_id = ?",
+            (status,now,registration_id),
+        ).rowcount
+        if updated:
             logger.debug(f"updating status for {registration_id} to {status}")
-            movie_registration['status'] = status
-            return # nothing more to be done
-
-
+            connection.execute(
+                "INSERT INTO status_history (registration_id, status, changed_at) VALUES (?, ?, ?)",
+                (registration_id,status,now),
+            )
 
+def mark_interrupted():
+    # jobs that were still running when the service stopped will never finish
+    placeholders = ','.join('?' for _ in finished_statuses)
+    rows = get_connection().execute(
+        f"SELECT registration_id FROM registrations WHERE status NOT IN ({placeholders})",
+        finished_statuses,
+    ).fetchall()
+    for row in rows:
+        update_status(row['registration_id'],'interrupted')
+    return len(rows)
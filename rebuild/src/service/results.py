@@ -0,0 +1,18 @@
+from utils.file_tools import iter_items
+from service.workspace import JobWorkspace
+
+import json
+
+# read side of finished jobs, kept apart from the processor (and pandas) so the
+# web process never imports the detectors and their models
+
+def process_player_team(registration_id):
+    # the team each player was first assigned, in order of first appearance
+    player_teams = {}
+    teams_location = JobWorkspace(registration_id).get_artifact('teams')
+    if teams_location is not None:
+        for team_track in iter_items(teams_location):
+            for tk,tv in team_track.items():
+                player_teams.setdefault(int(tk),int(tv))
+    # same records layout pandas to_json(orient='records') produced
+    return json.dumps([{'player_id':tk,'team_id':tv} for tk,tv in player_teams.items()],separators=(',',':'))
@@ -0,0 +1,213 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from logging_config import setup_logging
+from service import registry
+from service.workspace import purge_expired
+
+logger = logging.getLogger(__name__)
+
+# number of worker processes running jobs, each keeps its own models warm
+worker_count = int(os.environ.get('WORKER_COUNT','2'))
+# jobs allowed to wait for a worker before uploads are rejected
+queue_size = int(os.environ.get('QUEUE_SIZE','16'))
+# load the models in every worker as soon as the service starts, rather than in the first job
+warm_up_on_start = os.environ.get('WARM_UP_ON_START','1') == '1'
+# how often expired workspaces are purged, from the scheduler rather than from every job
+purge_interval_hours = float(os.environ.get('PURGE_INTERVAL_HOURS','1'))
+
+class QueueFullError(Exception):
+    pass
+
+def init_worker(warm_up_models=False,ready_workers=None,started_workers=None):
+    # runs once in every worker process, before it takes any task, so with warm up on
+    # no job ever lands on a worker whose models are still cold
+    setup_logging()
+    if not warm_up_models:
+        return
+    # raising here would break the whole pool, a worker that fails to warm up loads lazily instead
+    try:
+        from detector.model_registry import warm_up, warm_up_errors, job_models
+        models = warm_up(job_models)
+        errors = sorted(warm_up_errors)
+    except Exception:
+        logger.exception("worker warm up failed")
+        errors = ['all']
+    if errors:
+        logger.error(f"worker failed to load models {errors}")
+    else:
+        logger.info(f"worker warmed up with models {models}")
+        with ready_workers.get_lock():
+            ready_workers.value += 1
+    with started_workers.get_lock():
+        started_workers.value += 1
+
+def run_job(video_location,registration_id):
+    # runs inside a worker process, the processor is only imported there
+    from service.processor import process
+    try:
+        process(video_location,registration_id)
+    except Exception:
+        logger.exception(f"job {registration_id} failed")
+        registry.update_status(registration_id,"failed")
+        raise
+    registry.update_status(registration_id,"complete")
+
+def wait_for_workers(started_workers,count,timeout):
+    # keeps its worker busy until every worker has finished warming up, so the pool spawns all of them
+    deadline = time.monotonic() + timeout
+    while started_workers.value < count and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return started_workers.value
+
+class JobScheduler:
+    # priority/FIFO queue in front of a fixed pool of worker processes
+    def __init__(self,worker_count=worker_count,queue_size=queue_size,warm_up_models=warm_up_on_start):
+        self.worker_count = worker_count
+        self.warm_up_models = warm_up_models
+        self.queue_size = queue_size
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.queued = {} # registration id -> (priority, sequence)
+        self.running = set()
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(worker_count)
+
+        # spawn keeps CUDA and the Flask server state out of the workers
+        self.context = multiprocessing.get_context('spawn')
+        self.executor = self.create_executor()
+
+        self.dispatcher = threading.Thread(target=self.dispatch,daemon=True)
+        self.dispatcher.start()
+
+        self.stopping = threading.Event()
+        self.purger = threading.Thread(target=self.purge,daemon=True)
+        self.purger.start()
+
+    def create_executor(self):
+        # every worker warms up in the pool initializer, counting itself in started_workers
+        # once done and in ready_workers if all of its models loaded
+        self.ready_workers = self.context.Value('i',0)
+        self.started_workers = self.context.Value('i',0)
+        return ProcessPoolExecutor(max_workers=self.worker_count,mp_context=self.context,
+                                   initializer=init_worker,initargs=(self.warm_up_models,self.ready_workers,self.started_workers))
+
+    def warm_up(self,timeout=600):
+        # the pool only spawns a worker when no idle one is left, so keep each spawned
+        # worker busy until all of them are warm; the initializer does the actual loading
+        if not self.warm_up_models:
+            return
+        with self.lock:
+            executor = self.executor
+            started_workers = self.started_workers
+        for _ in range(self.worker_count):
+            executor.submit(wait_for_workers,started_workers,self.worker_count,timeout)
+        logger.info(f"warming up {self.worker_count} workers")
+
+    def is_ready(self):
+        # ready once every worker process of the pool has loaded its models, or when no
+        # warm up was asked for
+        return not self.warm_up_models or self.ready_workers.value >= self.worker_count
+
+    def get_warm_up_progress(self):
+        return {'workers':self.worker_count,'ready':self.ready_workers.value if self.warm_up_models else self.worker_count}
+
+    def purge(self):
+        # a single thread purges, so workers never race to delete the same workspaces;
+        # the service purges once at startup, this keeps purging while it runs
+        while not self.stopping.wait(purge_interval_hours * 3600):
+            try:
+                purged = purge_expired()
+            except OSError:
+                logger.exception("purging expired workspaces failed")
+                continue
+            if purged:
+                logger.info(f"purged {purged} expired workspaces")
+
+    def is_full(self):
+        with self.lock:
+            return len(self.queued) >= self.queue_size
+
+    def submit(self,video_location,registration_id,priority=0):
+        # lower priority values run first, equal priorities run in arrival order
+        with self.lock:
+            if len(self.queued) >= self.queue_size:
+                raise QueueFullError(f"{len(self.queued)} jobs already queued")
+            sequence = next(self.sequence)
+            self.queued[registration_id] = (priority,sequence)
+            registry.update_status(registration_id,"queued")
+            self.queue.put((priority,sequence,registration_id,video_location))
+        logger.info(f"queued {registration_id} with priority {priority}")
+
+    def dispatch(self):
+        while True:
+            self.slots.acquire()
+            _,_,registration_id,video_location = self.queue.get()
+            if registration_id is None:
+                return # shutdown
+            with self.lock:
+                self.queued.pop(registration_id,None)
+                self.running.add(registration_id)
+            logger.info(f"starting {registration_id}")
+            executor = self.executor
+            future = executor.submit(run_job,video_location,registration_id)
+            future.add_done_callback(partial(self.job_done,registration_id,executor))
+
+    def job_done(self,registration_id,executor,future):
+        with self.lock:
+            self.running.discard(registration_id)
+        self.slots.release()
+        # the worker reports its own final status, only a dead worker needs handling here
+        if isinstance(future.exception(),BrokenProcessPool):
+            logger.error(f"worker running {registration_id} died, restarting the pool")
+            registry.update_status(registration_id,"failed")
+            restarted = False
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = self.create_executor()
+                    restarted = True
+            if restarted:
+                self.warm_up()
+        logger.info(f"finished {registration_id}")
+
+    def get_queue_position(self,registration_id):
+        # 1 based position in the queue, None once the job has started
+        with self.lock:
+            entry = self.queued.get(registration_id)
+            if entry is None:
+                return None
+            return sum(1 for other in self.queued.values() if other < entry) + 1
+
+    def get_queue_depth(self):
+        with self.lock:
+            return len(self.queued)
+
+    def get_running_count(self):
+        with self.lock:
+            return len(self.running)
+
+    def shutdown(self,wait=True):
+        self.stopping.set()
+        self.queue.put((float('-inf'),-1,None,None))
+        self.slots.release() # let the dispatcher reach the sentinel
+        self.executor.shutdown(wait=wait)
+
+scheduler = None
+scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    # created on first use, never at import, as spawned workers re-import the main module
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = JobScheduler()
+        return scheduler
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+workspace_root = os.environ.get('WORKSPACE_ROOT',os.path.join(tempfile.gettempdir(),'basketball-jobs'))
+# workspaces not touched for this long are deleted by purge_expired
+retention_hours = float(os.environ.get('WORKSPACE_RETENTION_HOURS','24'))
+
+artifact_files = {
+    'frames': 'frames.raw',
+    'tracks': 'tracks.pkl',
+    'ball': 'ball.pkl',
+    'teams': 'teams.pkl',
+}
+# removed once a job finishes, whether it succeeded or not, the remaining artifacts are kept for the retention period
+intermediate_artifacts = ['video','frames']
+
+class JobWorkspace:
+    # a directory per registration holding every artifact of that job plus a manifest,
+    # so concurrent jobs never share intermediate files
+    def __init__(self,registration_id,root=None):
+        if not registration_id or os.path.basename(registration_id) != registration_id or registration_id in ('.','..'):
+            raise ValueError(f"invalid registration id {registration_id}")
+        self.registration_id = registration_id
+        self.path = os.path.join(root or workspace_root,registration_id)
+        self.manifest_path = os.path.join(self.path,'manifest.json')
+        self.lock = threading.Lock()
+
+    def create(self):
+        os.makedirs(self.path,exist_ok=True)
+        if not os.path.exists(self.manifest_path):
+            now = time.time()
+            self.write_manifest({
+                'registration_id': self.registration_id,
+                'created_at': now,
+                'updated_at': now,
+                'artifacts': {},
+            })
+        return self
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def artifact_path(self,name):
+        return os.path.join(self.path,artifact_files[name])
+
+    def video_path(self,extension=''):
+        return os.path.join(self.path,f"video{extension}")
+
+    def read_manifest(self):
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def write_manifest(self,manifest):
+        # write then rename so readers never see a half written manifest
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path,'w') as f:
+            json.dump(manifest,f)
+        os.replace(tmp_path,self.manifest_path)
+
+    def record_artifact(self,name,path=None):
+        path = path or self.artifact_path(name)
+        with self.lock:
+            manifest = self.read_manifest()
+            now = time.time()
+            manifest['artifacts'][name] = {
+                'file': os.path.basename(path),
+                'size': os.path.getsize(path),
+                'created_at': now,
+            }
+            manifest['updated_at'] = now
+            self.write_manifest(manifest)
+        logger.info(f"{self.registration_id}: recorded artifact {name}")
+
+    def get_artifact(self,name):
+        # path of a produced artifact, None until the job has recorded it
+        if not self.exists():
+            return None
+        artifact = self.read_manifest()['artifacts'].get(name)
+        if artifact is None:
+            return None
+        return os.path.join(self.path,artifact['file'])
+
+    def remove_artifact(self,name):
+        with self.lock:
+            manifest = self.read_manifest()
+            artifact = manifest['artifacts'].pop(name,None)
+            if artifact is None:
+                return
+            path = os.path.join(self.path,artifact['file'])
+            # artifacts may carry a json header/index next to them
+            for file_path in (path,f"{path}.json"):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            manifest['updated_at'] = time.time()
+            self.write_manifest(manifest)
+
+    def cleanup_intermediates(self):
+        for name in intermediate_artifacts:
+            self.remove_artifact(name)
+            # a job that failed half way may have written the file without recording it
+            if name in artifact_files:
+                path = self.artifact_path(name)
+                for file_path in (path,f"{path}.json"):
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+
+    def delete(self):
+        shutil.rmtree(self.path,ignore_errors=True)
+
+def purge_expired(root=None,max_age_hours=None):
+    root = root or workspace_root
+    max_age_hours = retention_hours if max_age_hours is None else max_age_hours
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    purged = 0
+    for registration_id in os.listdir(root):
+        workspace = JobWorkspace(registration_id,root)
+        try:
+            updated_at = workspace.read_manifest()['updated_at']
+        except (OSError,ValueError,KeyError):
+            updated_at = os.path.getmtime(workspace.path)
+        if updated_at < cutoff:
+            logger.info(f"purging expired workspace {registration_id}")
+            workspace.delete()
+            purged += 1
+    return purged
@@ -0,0 +1,96 @@
+import copy
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from detector.ball import BallTrackRefiner, refine, remove_wrong_detections
+
+
+def make_track(seed, frame_count=300, max_gap=8):
+    # ball moving a few pixels a frame, with missed frames and some far off false detections
+    rng = np.random.default_rng(seed)
+    x, y = 500.0, 300.0
+    ball_tracks = []
+    while len(ball_tracks) < frame_count:
+        if rng.random() < 0.1:
+            ball_tracks += [{}] * int(rng.integers(1, max_gap + 1))
+            continue
+        x += rng.uniform(-10, 10)
+        y += rng.uniform(-10, 10)
+        # the first detection is real, the jump filter starts from it
+        if any(ball_tracks) and rng.random() < 0.1:
+            bx, by = rng.uniform(0, 1000, 2)
+        else:
+            bx, by = x, y
+        ball_tracks.append({1: {'bbox': np.float32([bx, by, bx + 10, by + 10]).tolist()}})
+    return ball_tracks[:frame_count]
+
+
+def refine_whole(ball_tracks):
+    return refine(remove_wrong_detections(copy.deepcopy(ball_tracks)))
+
+
+def refine_streamed(ball_tracks, batch_size, refiner):
+    refined = []
+    for start in range(0, len(ball_tracks), batch_size):
+        refined += refiner.update(copy.deepcopy(ball_tracks[start:start + batch_size]))
+        # everything but the last `latency` frames received so far is final
+        assert len(refined) == max(min(start + batch_size, len(ball_tracks)) - refiner.latency, 0)
+    return refined + refiner.flush()
+
+
+def longest_gap(ball_tracks):
+    # frames from the start, or from a kept detection, to the next kept detection
+    kept = [i for i, ball_track in enumerate(remove_wrong_detections(copy.deepcopy(ball_tracks))) if ball_track]
+    return max(b - a for a, b in zip([-1] + kept, kept))
+
+
+def test_streamed_matches_whole_video():
+    latency = 30
+    for seed in range(10):
+        ball_tracks = make_track(seed)
+        assert longest_gap(ball_tracks) <= latency
+        expected = refine_whole(ball_tracks)
+        for batch_size in (1, 7, latency - 1, latency, latency + 1, len(ball_tracks)):
+            assert refine_streamed(ball_tracks, batch_size, BallTrackRefiner(latency=latency)) == expected
+
+
+def test_gap_at_latency():
+    latency = 20
+    track = [{1: {'bbox': [float(10 + 2 * i), 100.0, float(20 + 2 * i), 110.0]}} for i in range(10)]
+    end = [{1: {'bbox': [60.0, 100.0, 70.0, 110.0]}}] * 5
+
+    # the frame after the last detection is `latency` frames before the next one
+    ball_tracks = track + [{}] * latency + end
+    assert refine_streamed(ball_tracks, 4, BallTrackRefiner(latency=latency)) == refine_whole(ball_tracks)
+
+    # one frame more and it can no longer look ahead to the next detection, so it holds
+    ball_tracks = track + [{}] * (latency + 1) + end
+    refined = refine_streamed(ball_tracks, 4, BallTrackRefiner(latency=latency))
+    assert refined[10] == track[-1]
+    assert refined[11:] == refine_whole(ball_tracks)[11:]
+
+
+def test_jump_across_batches():
+    ball_tracks = [{1: {'bbox': [float(10 + 2 * i), 100.0, float(20 + 2 * i), 110.0]}} for i in range(40)]
+    # false detections right after a batch boundary are compared with the last kept one
+    ball_tracks[10] = {1: {'bbox': [900.0, 700.0, 910.0, 710.0]}}
+    ball_tracks[11] = {1: {'bbox': [905.0, 702.0, 915.0, 712.0]}}
+    expected = refine_whole(ball_tracks)
+    assert expected[10] == {1: {'bbox': [30.0, 100.0, 40.0, 110.0]}}
+    assert refine_streamed(ball_tracks, 10, BallTrackRefiner(latency=5)) == expected
+
+
+def test_no_detections():
+    assert refine_streamed([{}] * 25, 10, BallTrackRefiner(latency=5)) == [{}] * 25
+
+
+def test_reset_between_videos():
+    first_video = make_track(0, frame_count=120)
+    second_video = make_track(1, frame_count=120)
+    refiner = BallTrackRefiner(latency=30)
+    refine_streamed(first_video, 16, refiner)
+    refiner.reset()
+    assert refine_streamed(second_video, 16, refiner) == refine_whole(second_video)
@@ -1,7 +1,73 @@
+import json
+import os
 import pickle
 
-def get_list(pkl_path):
-    values = []
+def get_index_path(pkl_path):
+    return f"{pkl_path}.json"
+
+def iter_records(pkl_path):
+    # every pickle.dump appended to the file is one record, usually a batch of frames
     with open(pkl_path,'rb') as f:
-        values = pickle.load(f)    
-    return values
\ No newline at end of file
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+def iter_items(pkl_path):
+    # flatten the records so callers see one item per frame
+    for record in iter_records(pkl_path):
+        yield from record
+
+def get_list(pkl_path):
+    # loads every record of the file, use RecordStream for long jobs
+    return list(iter_items(pkl_path))
+
+class ArtifactWriter:
+    # appends records to an artifact and writes an index with the totals on close
+    def __init__(self,pkl_path):
+        self.pkl_path = pkl_path
+        self.record_count = 0
+        self.item_count = 0
+        self.file = open(pkl_path,'wb')
+
+    def write(self,record):
+        pickle.dump(record,self.file)
+        self.record_count += 1
+        self.item_count += len(record)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        with open(get_index_path(self.pkl_path),'w') as f:
+            json.dump({'records': self.record_count, 'items': self.item_count},f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+class RecordStream:
+    # lazy concatenation of every record in an artifact with a known total length,
+    # iterating it only ever holds one record in memory
+    def __init__(self,pkl_path):
+        self.pkl_path = pkl_path
+        self.item_count = None
+
+    def __len__(self):
+        if self.item_count is None:
+            self.item_count = self.read_item_count()
+        return self.item_count
+
+    def __iter__(self):
+        return iter_items(self.pkl_path)
+
+    def read_item_count(self):
+        index_path = get_index_path(self.pkl_path)
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(self.pkl_path):
+            with open(index_path) as f:
+                return json.load(f)['items']
+        # no index, count with a single pass over the records
+        return sum(len(record) for record in iter_records(self.pkl_path))
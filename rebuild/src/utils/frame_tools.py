@@ -1,31 +1,76 @@
 import cv2
-import pickle
+import json
+import numpy as np
+import os
+
+def get_header_path(frames_name):
+    return f"{frames_name}.json"
 
 def save_frames(video_path,frames_name):
-    batch_size = 20 # TODO allow overrides
-    frames = []
+    # write every frame back to back as raw uint8 so readers can memory map them,
+    # the shape/fps header is written once the real frame count is known
+    frame_count = 0
+    frame_shape = None
     cap = cv2.VideoCapture(video_path)
-    frame_num = 0
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
     with open(frames_name,'wb') as f:
         while True:
             ret, frame = cap.read()
             if not ret:
                 break
-            frames.append(frame)
-            if len(frames) == batch_size:
-                # write it out
-                pickle.dump(frames,f)
-                frames = [] #reset
-        if frames:
-            # dump the last of it
-            pickle.dump(frames,f)
+            if frame_shape is None:
+                frame_shape = frame.shape
+            elif frame.shape != frame_shape:
+                raise ValueError(f"frame {frame_count} has shape {frame.shape}, expected {frame_shape}")
+            f.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+            frame_count += 1
     cap.release()
 
+    height, width, channels = frame_shape if frame_shape is not None else (0,0,3)
+    header = {
+        'frame_count': frame_count,
+        'height': height,
+        'width': width,
+        'channels': channels,
+        'fps': fps,
+        'dtype': 'uint8',
+    }
+    header_path = get_header_path(frames_name)
+    with open(f"{header_path}.tmp",'w') as f:
+        json.dump(header,f)
+    os.replace(f"{header_path}.tmp",header_path)
+    return frame_count
+
+class FrameStore:
+    # read-only view over frames written by save_frames, every frame or range of
+    # frames is a zero-copy view into the memory mapped file
+    def __init__(self,frames_name):
+        with open(get_header_path(frames_name)) as f:
+            header = json.load(f)
+        self.frames_name = frames_name
+        self.fps = header['fps']
+        self.shape = (header['frame_count'],header['height'],header['width'],header['channels'])
+        if header['frame_count'] == 0:
+            self.frames = np.empty(self.shape,dtype=np.uint8)
+        else:
+            self.frames = np.memmap(frames_name,dtype=np.uint8,mode='r',shape=self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self,index):
+        return self.frames[index]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def batches(self,batch_size=20):
+        # yields (start frame index, list of frame views)
+        for start in range(0,len(self),batch_size):
+            yield start, list(self.frames[start:start+batch_size])
+
 def write_frame(frame,path):
     cv2.imwrite(path, frame)
 
-def get_frames(pkl_path):
-    frames = []
-    with open(pkl_path,'rb') as f:
-        frames = pickle.load(f)    
-    return frames
\ No newline at end of file
+def get_frames(frames_name):
+    return FrameStore(frames_name)